@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Client benchmarks against the stand-in service
+
+Each scenario run is made in a new process so its wall time and peak memory
+are measured apart from the benchmark itself and the stand-in service: ::
+
+    python benchmarks/run.py --locales 30 --messages 2000 --output before.json
+    python benchmarks/run.py --locales 30 --messages 2000 --compare before.json
+
+Several tarball compressions can be compared, the scenarios are run for each
+one: ::
+
+    python benchmarks/run.py --compression gz,xz,bz2,none --scenarios pull_commit
+
+Available scenarios are:
+
+* 'pull_commit': pull and install the tarball into an empty locale dir;
+* 'pull_nocommit': pull the tarball without installing it;
+* 'push': push a POT file of the same number of messages.
+"""
+import argparse, json, logging, os, resource, shutil, subprocess, sys, tempfile, time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from server import StandInService, build_catalog
+
+SCENARIOS = ['pull_commit', 'pull_nocommit', 'push']
+
+# Result items with their display label and format
+RESULT_ITEMS = [
+    ('wall', 'Wall time (s)', '{0:.3f}'),
+    ('rss_kb', 'Peak RSS (KB)', '{0}'),
+    ('bytes_down', 'Downloaded (B)', '{0}'),
+    ('bytes_up', 'Uploaded (B)', '{0}'),
+    ('requests', 'Requests', '{0}'),
+]
+
+def run_child(scenario, url, slug, workdir, compression=None):
+    """
+    Run a scenario in the current process and print its measures as JSON
+    """
+    from po_projects_client.client import POProjectClient
+    logging.getLogger('po_projects_client').addHandler(logging.NullHandler())
+    
+    client = POProjectClient(url, ('bench', 'bench'), compression=compression)
+    start = time.time()
+    client.connect(dry_run=True)
+    if scenario == 'pull_commit':
+        client.pull(slug, os.path.join(workdir, 'locale'), 'django')
+    elif scenario == 'pull_nocommit':
+        client.pull(slug, os.path.join(workdir, 'locale'), 'django', commit=False)
+    elif scenario == 'push':
+        client.push(slug, os.path.join(workdir, 'locale'), 'messages', mode='gzip')
+    wall = time.time()-start
+    client.close()
+    
+    print json.dumps({'wall': wall, 'rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss})
+
+def run_scenario(service, scenario, messages, repeat, compression=None):
+    """
+    Run a scenario several times in child processes
+    
+    Return the median wall time, the maximum peak RSS and the transfer stats
+    """
+    runs = []
+    for i in range(repeat):
+        workdir = tempfile.mkdtemp(suffix='_po-projects-bench')
+        try:
+            if scenario == 'push':
+                os.makedirs(os.path.join(workdir, 'locale', 'LC_MESSAGES'))
+                with open(os.path.join(workdir, 'locale', 'LC_MESSAGES', 'messages.pot'), 'wb') as fp:
+                    fp.write(build_catalog('en', messages, translated=False))
+            service.reset_stats()
+            command = [sys.executable, os.path.abspath(__file__), '--child', scenario, '--url', service.url, '--slug', service.slug, '--workdir', workdir]
+            if compression:
+                command += ['--child_compression', compression]
+            output = subprocess.check_output(command)
+            datas = json.loads(output.strip().splitlines()[-1])
+            datas.update({
+                'bytes_down': service.stats['bytes_sent'],
+                'bytes_up': service.stats['bytes_received'],
+                'requests': service.stats['requests'],
+            })
+            runs.append(datas)
+        finally:
+            shutil.rmtree(workdir)
+    
+    walls = sorted([item['wall'] for item in runs])
+    result = runs[-1].copy()
+    result['wall'] = walls[len(walls)//2]
+    result['rss_kb'] = max([item['rss_kb'] for item in runs])
+    return result
+
+def print_results(results, previous=None, keys=None):
+    """
+    Print the results table, with the change from the previous results if any
+    """
+    for scenario in keys or SCENARIOS:
+        if scenario not in results:
+            continue
+        print scenario
+        for key, label, format in RESULT_ITEMS:
+            value = results[scenario][key]
+            line = '    {0:<16} {1:>14}'.format(label, format.format(value))
+            old = (previous or {}).get(scenario, {}).get(key)
+            if old:
+                line += '  ({0:+.1f}%)'.format((value-old)*100.0/old)
+            print line
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the client against a stand-in service")
+    parser.add_argument('--locales', default=10, type=int, help="Number of locales in the tarball")
+    parser.add_argument('--messages', default=1000, type=int, help="Number of messages per catalog")
+    parser.add_argument('--compression', default='gz', help="Tarball compression ('gz', 'xz', 'bz2' or 'none'), or a comma separated list of compressions to compare")
+    parser.add_argument('--repeat', default=3, type=int, help="Number of runs for each scenario")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help="Comma separated scenarios to run")
+    parser.add_argument('--output', default=None, help="Path to save the results as JSON")
+    parser.add_argument('--compare', default=None, help="Path to previous JSON results to compare with")
+    # Internal arguments for the scenario child processes
+    parser.add_argument('--child', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--url', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--slug', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--child_compression', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.child:
+        return run_child(args.child, args.url, args.slug, args.workdir, compression=args.child_compression)
+    
+    compressions = args.compression.split(',')
+    for compression in compressions:
+        if compression not in ('gz', 'xz', 'bz2', 'none'):
+            parser.error("Invalid compression: {0}".format(compression))
+    
+    # The service negotiates the compression the client prefers
+    service = StandInService(locales=args.locales, messages=args.messages)
+    service.start()
+    params = {'locales': args.locales, 'messages': args.messages, 'compression': args.compression}
+    results, keys = {}, []
+    try:
+        for compression in compressions:
+            for scenario in args.scenarios.split(','):
+                key = scenario if len(compressions) == 1 else '{0} ({1})'.format(scenario, compression)
+                keys.append(key)
+                results[key] = run_scenario(service, scenario, args.messages, args.repeat, compression=compression)
+    finally:
+        service.stop()
+    
+    previous = None
+    if args.compare:
+        with open(args.compare, 'rb') as fp:
+            previous = json.load(fp)
+        if previous['params'] != params:
+            print "Warning: compared results were made with other parameters: {0}".format(previous['params'])
+        previous = previous['results']
+    
+    print_results(results, previous, keys=keys)
+    
+    if args.output:
+        with open(args.output, 'wb') as fp:
+            json.dump({'params': params, 'results': results}, fp, indent=1, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+Stand-in PO-Projects service for the benchmarks
+
+It implements the endpoints used by the client ('projects/',
+'projects/current/<slug>/' and the project tarball, with range requests, locales filter and
+compression negotiation) and serves synthetic tarballs built from a given number of locales and
+messages.
+
+It can be run alone to play with the client: ::
+
+    python benchmarks/server.py --locales 30 --messages 2000 --port 8001
+
+Then use 'http://127.0.0.1:8001/rest/' as the host and 'bench' as the
+project slug (any user and password are accepted).
+"""
+import argparse, BaseHTTPServer, gzip, hashlib, io, json, SocketServer, tarfile, threading, urlparse
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+# Tarball compressions by media type, '' is uncompressed
+COMPRESSION_TYPES = {
+    'application/gzip': 'gz',
+    'application/x-gzip': 'gz',
+    'application/x-bzip2': 'bz2',
+    'application/x-xz': 'xz',
+    'application/x-tar': '',
+}
+
+LOCALE_NAMES = ['en', 'fr', 'de', 'es', 'it', 'pt', 'nl', 'pl', 'ru', 'ja', 'zh', 'ko', 'ar', 'tr', 'sv', 'da', 'fi', 'no', 'cs', 'hu', 'ro', 'el', 'he', 'uk', 'bg', 'hr', 'sk', 'sl', 'lt', 'lv']
+
+def build_catalog(locale, messages, translated=True):
+    """
+    Return a synthetic PO catalog content with the given number of messages
+    """
+    lines = [
+        'msgid ""',
+        'msgstr ""',
+        '"Project-Id-Version: bench\\n"',
+        '"Language: {0}\\n"'.format(locale),
+        '"Content-Type: text/plain; charset=UTF-8\\n"',
+        '',
+    ]
+    for i in range(messages):
+        lines.append('#: bench/templates/page_{0}.html:{1}'.format(i//50, i%50))
+        lines.append('msgid "Benchmark message number {0} with some text"'.format(i))
+        if translated:
+            lines.append('msgstr "[{0}] Benchmark message number {1} with some text"'.format(locale, i))
+        else:
+            lines.append('msgstr ""')
+        lines.append('')
+    return '\n'.join(lines)
+
+def locale_names(count):
+    """
+    Return the given number of locale names
+    """
+    names = LOCALE_NAMES[:count]
+    names += ['x{0}'.format(i) for i in range(count-len(names))]
+    return names
+
+def build_tarball(locales, messages, kind='django', compression='gz', only=None):
+    """
+    Return a synthetic project tarball content, limited to the @only locale
+    names if given
+    """
+    fileobj = io.BytesIO()
+    # Python 2 tarfile can not write 'xz' archives, the tar is compressed after
+    tar = tarfile.open(fileobj=fileobj, mode='w:{0}'.format(compression) if compression in ('gz', 'bz2') else 'w')
+    for locale in locale_names(locales):
+        if only and locale not in only:
+            continue
+        content = build_catalog(locale, messages)
+        info = tarfile.TarInfo('locale/{0}/LC_MESSAGES/{1}.po'.format(locale, kind))
+        info.size = len(content)
+        tar.addfile(info, io.BytesIO(content))
+    tar.close()
+    if compression == 'xz':
+        return lzma.compress(fileobj.getvalue())
+    return fileobj.getvalue()
+
+def negotiate_compression(accept, default):
+    """
+    Return the compression for the 'Accept' header value, the one with the
+    best quality that the service can build, else the default one
+    """
+    choices = []
+    for index, item in enumerate((accept or '').split(',')):
+        parts = [part.strip() for part in item.split(';')]
+        quality = 1.0
+        for part in parts[1:]:
+            if part.startswith('q='):
+                quality = float(part[2:])
+        compression = COMPRESSION_TYPES.get(parts[0])
+        if compression is not None and (compression != 'xz' or lzma is not None):
+            choices.append((-quality, index, compression))
+    return sorted(choices)[0][2] if choices else default
+
+
+class StandInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def send_body(self, status, body, content_type='application/json', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.service.count('bytes_sent', len(body))
+    
+    def do_GET(self):
+        service = self.server.service
+        service.count('requests', 1)
+        url = urlparse.urlparse(self.path)
+        params = urlparse.parse_qs(url.query)
+        
+        if url.path == '/rest/':
+            return self.send_body(200, json.dumps({'projects': service.url+'projects/'}))
+        if url.path == '/rest/projects/':
+            return self.send_body(200, json.dumps([service.project_datas()]))
+        if url.path == '/rest/projects/current/{0}/'.format(service.slug):
+            return self.send_body(200, json.dumps(service.project_datas()))
+        if url.path == '/rest/projects/tarball/{0}/'.format(service.slug):
+            only = params['locales'][0].split(',') if 'locales' in params else None
+            compression = negotiate_compression(self.headers.get('Accept'), service.compression) if service.negotiate else service.compression
+            body, etag = service.get_tarball(params.get('kind', ['django'])[0], only, compression)
+            if etag in (self.headers.get('If-None-Match') or ''):
+                return self.send_body(304, '', headers={'ETag': etag})
+            start = (self.headers.get('Range') or '')[len('bytes='):].rstrip('-')
+            if start.isdigit() and self.headers.get('If-Range', etag) == etag:
+                if int(start) >= len(body):
+                    # Like real servers, a range starting after the end is refused
+                    return self.send_body(416, '', headers={'ETag': etag, 'Content-Range': 'bytes */{0}'.format(len(body))})
+                content_range = 'bytes {0}-{1}/{2}'.format(start, len(body)-1, len(body))
+                return self.send_body(206, body[int(start):], 'application/x-tar', headers={'ETag': etag, 'Content-Range': content_range})
+            return self.send_body(200, body, 'application/x-tar', headers={'ETag': etag})
+        return self.send_body(404, json.dumps({'detail': 'Not found'}))
+    
+    def do_PATCH(self):
+        service = self.server.service
+        service.count('requests', 1)
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        service.count('bytes_received', len(body))
+        if urlparse.urlparse(self.path).path != '/rest/projects/current/{0}/'.format(service.slug):
+            return self.send_body(404, json.dumps({'detail': 'Not found'}))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.GzipFile(fileobj=io.BytesIO(body)).read()
+        if 'json' in (self.headers.get('Content-Type') or ''):
+            json.loads(body)['pot']
+        return self.send_body(200, json.dumps(service.project_datas()))
+
+
+class ThreadedHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class StandInService(object):
+    """
+    The stand-in service, running in a background thread
+    
+    'stats' counts the requests and the body bytes sent and received.
+    """
+    def __init__(self, slug='bench', locales=10, messages=1000, compression='gz', negotiate=True, host='127.0.0.1', port=0):
+        """
+        @compression is the tarball compression used when the client does not 
+        ask for one, or always if @negotiate is False
+        """
+        self.slug = slug
+        self.locales = locales
+        self.messages = messages
+        self.compression = compression
+        self.negotiate = negotiate
+        self._tarballs = {}
+        self._lock = threading.Lock()
+        self.reset_stats()
+        
+        self.httpd = ThreadedHTTPServer((host, port), StandInHandler)
+        self.httpd.service = self
+        self.url = 'http://{0}:{1}/rest/'.format(*self.httpd.server_address)
+        self.thread = None
+    
+    def reset_stats(self):
+        self.stats = {'requests': 0, 'bytes_sent': 0, 'bytes_received': 0}
+    
+    def count(self, name, value):
+        with self._lock:
+            self.stats[name] += value
+    
+    def project_datas(self):
+        return {
+            'id': 1,
+            'slug': self.slug,
+            'tarball_url': '{0}projects/tarball/{1}/'.format(self.url, self.slug),
+            'domains': ['django', 'djangojs', 'messages'],
+        }
+    
+    def get_tarball(self, kind, only=None, compression=None):
+        """
+        Return the tarball content and its ETag for the given kind, locale
+        names and compression, they are built only once
+        """
+        compression = self.compression if compression is None else compression
+        key = (kind, tuple(sorted(only or [])), compression)
+        with self._lock:
+            if key not in self._tarballs:
+                body = build_tarball(self.locales, self.messages, kind=kind, compression=compression, only=only)
+                self._tarballs[key] = (body, '"{0}"'.format(hashlib.sha1(body).hexdigest()))
+            return self._tarballs[key]
+    
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self.url
+    
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Stand-in PO-Projects service")
+    parser.add_argument('--port', default=8001, type=int)
+    parser.add_argument('--slug', default='bench')
+    parser.add_argument('--locales', default=10, type=int)
+    parser.add_argument('--messages', default=1000, type=int)
+    parser.add_argument('--compression', default='gz', choices=['gz', 'bz2', 'xz', ''], help="Tarball compression when the client does not ask for one")
+    parser.add_argument('--no_negotiate', default=False, action='store_true', help="Always use the '--compression' one")
+    args = parser.parse_args()
+    
+    service = StandInService(slug=args.slug, locales=args.locales, messages=args.messages, compression=args.compression, negotiate=not args.no_negotiate, port=args.port)
+    print "Serving on {0} (project slug: {1})".format(service.url, service.slug)
+    try:
+        service.httpd.serve_forever()
+    except KeyboardInterrupt:
+        service.stop()
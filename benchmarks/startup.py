@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Command line startup check
+
+The CLI module must not import the command modules and their heavy
+dependencies, they are imported when a command is dispatched. This script
+imports the CLI module in new processes and fails if one of the heavy modules
+has been imported, or if the median time of the '--version' command is over
+the given budget: ::
+
+    python benchmarks/startup.py --budget 150
+
+Python 2 has no '-X importtime' option, the modules are checked from
+'sys.modules' and the import time is measured around the import.
+"""
+import argparse, json, os, subprocess, sys, time
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must not be imported by the CLI module itself
+HEAVY_MODULES = [
+    'requests',
+    'tarfile',
+    'multiprocessing',
+    'ctypes',
+    'ConfigParser',
+    'po_projects_client.client',
+    'po_projects_client.compiler',
+    'po_projects_client.session',
+]
+
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.time()
+import po_projects_client.cli
+elapsed = time.time()-start
+heavy = [name for name in {modules!r} if name in sys.modules]
+sys.stdout.write(json.dumps({{'import': elapsed, 'heavy': heavy}}))
+"""
+
+VERSION_SCRIPT = """
+import sys
+sys.argv = ['po_projects', '--version']
+from po_projects_client.cli import main
+main()
+"""
+
+def run_python(script):
+    """
+    Run a Python script in a new process from the package directory, return
+    its output and wall time
+    """
+    start = time.time()
+    output = subprocess.check_output([sys.executable, '-c', script], cwd=PACKAGE_DIR, stderr=subprocess.STDOUT)
+    return output, time.time()-start
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the command line startup time and imported modules")
+    parser.add_argument('--repeat', default=5, type=int, help="Number of runs")
+    parser.add_argument('--budget', default=None, type=float, help="Maximum median wall time in milliseconds of 'po_projects --version'")
+    args = parser.parse_args()
+    
+    script = IMPORT_SCRIPT.format(modules=HEAVY_MODULES)
+    imports, walls, heavy = [], [], set([])
+    for i in range(args.repeat):
+        output, wall = run_python(script)
+        datas = json.loads(output.strip().splitlines()[-1])
+        imports.append(datas['import'])
+        heavy.update(datas['heavy'])
+        walls.append(run_python(VERSION_SCRIPT)[1])
+    
+    import_time = sorted(imports)[len(imports)//2]*1000
+    wall = sorted(walls)[len(walls)//2]*1000
+    print "CLI module import:     {0:>8.1f}ms".format(import_time)
+    print "'--version' wall time: {0:>8.1f}ms".format(wall)
+    
+    failed = False
+    if heavy:
+        print "Error: heavy modules imported by the CLI module: {0}".format(', '.join(sorted(heavy)))
+        failed = True
+    if args.budget is not None and wall > args.budget:
+        print "Error: '--version' wall time is over the budget of {0}ms".format(args.budget)
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
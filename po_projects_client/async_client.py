@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Non blocking client API to embed the client in an application
+
+The operations run on a bounded thread pool, each with its own
+POProjectClient sharing the same HTTP session and state.
+"""
+from multiprocessing.pool import ThreadPool
+
+from po_projects_client.session import build_session
+from po_projects_client.client import POProjectClient
+
+class AsyncPOProjectClient(object):
+    """
+    Client running the POProjectClient operations in background
+    
+    ``connect``, ``get_project``, ``pull`` and ``push`` methods take the same
+    arguments than the POProjectClient ones and return at once an
+    ``AsyncResult`` (see ``multiprocessing.pool``). Its ``get()`` method
+    waits for the operation and returns the POProjectClient which made it,
+    whose attributes ('project_id', 'updated', 'tarball_validators',
+    'pushed', 'metrics', etc..) describe the result, or raise the operation
+    exception (like ``ProjectDoesNotExistException``).
+    
+    At most @concurrency operations are running at the same time, the other
+    ones are queued.
+    """
+    default_concurrency = 4
+    
+    def __init__(self, root_url, auth_settings, concurrency=None, **client_kwargs):
+        """
+        @client_kwargs are the POProjectClient optional arguments, if no
+        'session' is given a shared one is built with enough connections for
+        the concurrent operations
+        """
+        self.root_url = root_url
+        self.auth_settings = auth_settings
+        self.concurrency = concurrency or self.default_concurrency
+        
+        self._own_session = client_kwargs.get('session') is None
+        if self._own_session:
+            client_kwargs['session'] = build_session(max(self.concurrency, client_kwargs.get('pool_size') or 0))
+        self.session = client_kwargs['session']
+        self.client_kwargs = client_kwargs
+        
+        self.pool = ThreadPool(self.concurrency)
+    
+    def get_client(self):
+        """
+        Return a new POProjectClient for an operation
+        """
+        client = POProjectClient(self.root_url, self.auth_settings, **self.client_kwargs)
+        client.connect(dry_run=True)
+        return client
+    
+    def run(self, method, *args, **kwargs):
+        """
+        Run a POProjectClient method in background with the given arguments
+        """
+        def operation():
+            client = self.get_client()
+            getattr(client, method)(*args, **kwargs)
+            return client
+        return self.pool.apply_async(operation)
+    
+    def connect(self):
+        return self.run('connect')
+    
+    def get_project(self, slug, refresh=False):
+        return self.run('get_project', slug, refresh=refresh)
+    
+    def pull(self, slug, destination, kind, **kwargs):
+        return self.run('pull', slug, destination, kind, **kwargs)
+    
+    def push(self, slug, locale_path, kind, **kwargs):
+        return self.run('push', slug, locale_path, kind, **kwargs)
+    
+    def close(self):
+        """
+        Wait for the queued operations then close the pool and the session
+        connections if the client owns it
+        """
+        self.pool.close()
+        self.pool.join()
+        if self._own_session:
+            self.session.close()
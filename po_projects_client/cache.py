@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Tarball cache directory shared between the working copies of a host
+"""
+import errno, hashlib, json, os, shutil, tempfile, time
+
+# Environment variable to enable the cache when it is not given by the config
+CACHE_DIR_ENVVAR = 'PO_PROJECTS_CACHE_DIR'
+
+class TarballCache(object):
+    """
+    A directory of downloaded tarballs, stored by content hash
+    
+    * 'tarballs/<sha1>' are the tarballs as they have been downloaded;
+    * 'refs/<key>.json' are the validators of the last tarball downloaded for
+      a project, kind and locales, with its hash and content encoding.
+    
+    Files are written to a temporary file renamed in place, so concurrent
+    processes only ever see complete files. Stored tarballs are never
+    modified, an opened one can still be read after its eviction. Least
+    recently used tarballs are removed to keep the directory under
+    @max_size bytes.
+    """
+    default_max_size = 500*1024*1024
+    
+    def __init__(self, dirpath, max_size=None):
+        self.dirpath = os.path.abspath(dirpath)
+        self.max_size = max_size or self.default_max_size
+        self.tarballs_dir = os.path.join(self.dirpath, 'tarballs')
+        self.refs_dir = os.path.join(self.dirpath, 'refs')
+        for path in (self.tarballs_dir, self.refs_dir):
+            try:
+                os.makedirs(path)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+    
+    def get_key(self, root_url, slug, kind, locales=None):
+        return hashlib.sha1('|'.join([root_url, slug, kind, ','.join(sorted(locales or []))])).hexdigest()
+    
+    def get_tarball_path(self, tarball_hash):
+        return os.path.join(self.tarballs_dir, tarball_hash)
+    
+    def _write_atomic(self, filepath, write):
+        fd, tmp_filepath = tempfile.mkstemp(prefix='.', suffix='.tmp', dir=os.path.dirname(filepath))
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                write(fp)
+            os.rename(tmp_filepath, filepath)
+        except:
+            os.remove(tmp_filepath)
+            raise
+    
+    def get(self, key):
+        """
+        Return the ref of the key, or None if there is no cached tarball for it
+        """
+        try:
+            with open(os.path.join(self.refs_dir, key+'.json'), 'rb') as fp:
+                ref = json.load(fp)
+        except (IOError, ValueError):
+            return None
+        if 'hash' not in ref or not os.path.exists(self.get_tarball_path(ref['hash'])):
+            return None
+        return ref
+    
+    def open(self, ref):
+        """
+        Return the opened tarball file of a ref and mark it as recently used,
+        or None if it has been evicted
+        """
+        tarball_path = self.get_tarball_path(ref['hash'])
+        try:
+            fileobj = open(tarball_path, 'rb')
+        except IOError:
+            return None
+        try:
+            os.utime(tarball_path, None)
+        except OSError:
+            pass
+        return fileobj
+    
+    def put(self, key, filepath, tarball_hash, ref):
+        """
+        Store a downloaded tarball file and the ref of the key to it
+        
+        @ref is a dict of the tarball infos to keep ('etag', 'last_modified'
+        and 'encoding'), the hash is added to it. Then evict the least
+        recently used tarballs if the cache is over its size.
+        """
+        tarball_path = self.get_tarball_path(tarball_hash)
+        try:
+            os.utime(tarball_path, None)
+        except OSError:
+            with open(filepath, 'rb') as source:
+                self._write_atomic(tarball_path, lambda fp: shutil.copyfileobj(source, fp))
+        
+        ref = dict(ref, hash=tarball_hash, time=time.time())
+        self._write_atomic(os.path.join(self.refs_dir, key+'.json'), lambda fp: json.dump(ref, fp))
+        
+        self.evict(keep=tarball_hash)
+    
+    def evict(self, keep=None):
+        """
+        Remove the least recently used tarballs until the cache is under its
+        size, the @keep tarball hash is never removed
+        
+        Return the number of removed tarballs
+        """
+        entries = []
+        for name in os.listdir(self.tarballs_dir):
+            if name.startswith('.'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.tarballs_dir, name))
+            except OSError:
+                # Removed by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        
+        total = sum([size for mtime, size, name in entries])
+        removed = 0
+        for mtime, size, name in sorted(entries):
+            if total <= self.max_size:
+                break
+            if name == keep:
+                continue
+            try:
+                os.remove(os.path.join(self.tarballs_dir, name))
+            except OSError:
+                pass
+            total -= size
+            removed += 1
+        return removed
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Gettext catalog helpers
+"""
+import array, codecs, collections, hashlib, os, re, struct, threading
+
+# Keyword lines of a catalog entry
+KEYWORD_LINE = re.compile(r'^(msgctxt|msgid_plural|msgid|msgstr(?:\[(\d+)\])?)\s+(".*")$')
+
+# Header fields that change on every extraction without any real change
+VOLATILE_HEADERS = re.compile(r'^"(POT-Creation-Date|PO-Revision-Date|X-Generator):.*"\s*$')
+
+def catalog_hash(filepath):
+    """
+    Return the SHA1 hex digest of a catalog content, ignoring the volatile
+    header fields
+    """
+    digest = hashlib.sha1()
+    with open(filepath, 'rb') as fp:
+        for line in fp:
+            if VOLATILE_HEADERS.match(line):
+                continue
+            digest.update(line)
+    return digest.hexdigest()
+
+Message = collections.namedtuple('Message', ['context', 'id', 'plural', 'strings', 'flags', 'obsolete'])
+
+def _unquote(string):
+    return codecs.escape_decode(string.strip()[1:-1])[0]
+
+def get_catalog_filepath(locale_path, kind, django_default_locale=None, domain=None):
+    """
+    Return the path of the catalog sent to the service for the given domain, 
+    default to the domain of the kind
+    
+    For 'django' kind it is the PO file of the default locale, else the POT 
+    file of the locale directory.
+    """
+    domain = domain or kind
+    if kind == 'django':
+        return os.path.join(locale_path, django_default_locale, "LC_MESSAGES", "{0}.po".format(domain))
+    return os.path.join(locale_path, "LC_MESSAGES", "{0}.pot".format(domain))
+
+def read_po(fileobj):
+    """
+    Parse a PO catalog and yield a Message for each of its entries
+    
+    Strings are keeped encoded like in the catalog, 'strings' is the tuple of
+    the translations (one item per plural form) and 'flags' the set of flags
+    (like 'fuzzy')
+    """
+    # Fields are indexed by keyword, plural translations by their form number
+    fields, flags, obsolete, section = {}, set([]), False, None
+    
+    def build():
+        if 'msgstr' in fields:
+            strings = (fields['msgstr'],)
+        else:
+            strings = tuple([fields[k] for k in sorted([k for k in fields if isinstance(k, int)])])
+        return Message(fields.get('msgctxt'), fields.get('msgid', ''), fields.get('msgid_plural'), strings, frozenset(flags), obsolete)
+    
+    def in_msgstr():
+        return section == 'msgstr' or isinstance(section, int)
+    
+    for line in fileobj:
+        line = line.strip()
+        is_obsolete = line.startswith('#~')
+        if is_obsolete:
+            line = line[2:].strip()
+        if not line:
+            continue
+        
+        if line.startswith('#'):
+            # Comments after a translation start a new entry
+            if in_msgstr():
+                yield build()
+                fields, flags, obsolete, section = {}, set([]), False, None
+            if line.startswith('#,'):
+                flags.update([item.strip() for item in line[2:].split(',')])
+            continue
+        
+        match = KEYWORD_LINE.match(line)
+        if match:
+            keyword, index, string = match.groups()
+            if keyword in ('msgctxt', 'msgid') and in_msgstr():
+                yield build()
+                fields, flags, obsolete, section = {}, set([]), False, None
+            section = int(index) if index is not None else keyword
+            fields[section] = _unquote(string)
+            obsolete = obsolete or is_obsolete
+        elif line.startswith('"') and section is not None:
+            fields[section] += _unquote(line)
+    
+    if fields:
+        yield build()
+
+def get_translations(messages):
+    """
+    Return a dict of the translation strings by (context, msgid) of the 
+    translated messages
+    
+    Obsolete, fuzzy and untranslated messages are ignored, so is the header.
+    """
+    translations = {}
+    for message in messages:
+        if not message.id or message.obsolete or 'fuzzy' in message.flags or not all(message.strings):
+            continue
+        translations[(message.context, message.id)] = message.strings
+    return translations
+
+def compare_translations(old, new):
+    """
+    Return a dict of counters for the 'added', 'changed' and 'removed' 
+    translations between two translations dicts (see ``get_translations``)
+    """
+    return {
+        'added': len([key for key in new if key not in old]),
+        'changed': len([key for key in new if key in old and new[key] != old[key]]),
+        'removed': len([key for key in old if key not in new]),
+    }
+
+def _quote(string):
+    string = string.replace('\\', '\\\\').replace('"', '\\"').replace('\t', '\\t').replace('\r', '\\r')
+    lines = string.split('\n')
+    if len(lines) == 1:
+        return '"{0}"'.format(lines[0])
+    # Multi lines strings start with an empty one, like xgettext does
+    lines = [item+'\\n' for item in lines[:-1]]+([lines[-1]] if lines[-1] else [])
+    return '\n'.join(['""']+['"{0}"'.format(item) for item in lines])
+
+def format_po(messages, locations=None):
+    """
+    Return the PO catalog content for the given messages
+    
+    @locations is an optional dict of the source references of the messages, 
+    a list of (path, line number) by (context, msgid)
+    """
+    locations = locations or {}
+    entries = []
+    for message in messages:
+        lines = []
+        references = locations.get((message.context, message.id))
+        if references:
+            lines.append('#: '+' '.join(['{0}:{1}'.format(path, lineno) for path, lineno in references]))
+        if message.flags:
+            lines.append('#, '+', '.join(sorted(message.flags)))
+        if message.context is not None:
+            lines.append('msgctxt '+_quote(message.context))
+        lines.append('msgid '+_quote(message.id))
+        if message.plural is not None:
+            lines.append('msgid_plural '+_quote(message.plural))
+            for index, string in enumerate(message.strings):
+                lines.append('msgstr[{0}] {1}'.format(index, _quote(string)))
+        else:
+            lines.append('msgstr '+_quote(message.strings[0] if message.strings else ''))
+        if message.obsolete:
+            lines = [item if item.startswith('#') else '#~ '+item for item in lines]
+        entries.append('\n'.join(lines)+'\n')
+    return '\n'.join(entries)
+
+def compile_messages(messages):
+    """
+    Return the MO catalog content for the given messages
+    
+    Obsolete, fuzzy and untranslated messages are ignored, except the header.
+    """
+    catalog = {}
+    for message in messages:
+        if message.obsolete or not all(message.strings):
+            continue
+        if message.id and 'fuzzy' in message.flags:
+            continue
+        key = message.id
+        if message.plural is not None:
+            key += '\0'+message.plural
+        if message.context is not None:
+            key = message.context+'\x04'+key
+        catalog[key] = '\0'.join(message.strings)
+    
+    # Build the MO structure (from CPython's Tools/i18n/msgfmt.py)
+    keys = sorted(catalog.keys())
+    ids, strs, koffsets, voffsets = [], [], [], []
+    keystart = 7*4+16*len(keys)
+    ids_length = sum([len(key)+1 for key in keys])
+    ids_offset = strs_offset = 0
+    for key in keys:
+        value = catalog[key]
+        koffsets += [len(key), keystart+ids_offset]
+        voffsets += [len(value), keystart+ids_length+strs_offset]
+        ids.append(key+'\0')
+        strs.append(value+'\0')
+        ids_offset += len(key)+1
+        strs_offset += len(value)+1
+    
+    output = [struct.pack('Iiiiiii', 0x950412de, 0, len(keys), 7*4, 7*4+len(keys)*8, 0, 0)]
+    output.append(array.array('i', koffsets+voffsets).tostring())
+    return ''.join(output+ids+strs)
+
+def write_atomic(filepath, content):
+    """
+    Write a file content through a temporary file renamed in place
+    
+    The temporary file name is unique for each process and thread writing
+    the same file.
+    """
+    tmp_filepath = os.path.join(os.path.dirname(filepath), '.{0}.{1}.{2}.tmp'.format(os.path.basename(filepath), os.getpid(), threading.current_thread().ident))
+    with open(tmp_filepath, 'wb') as fp:
+        fp.write(content)
+    os.rename(tmp_filepath, filepath)
@@ -2,21 +2,21 @@
 """
 Command line action
 
+Command modules and their heavy dependencies (requests, tarfile, multiprocessing, etc..) are imported only when a command is dispatched, so the help and version outputs stay fast. Keep it so, 'benchmarks/startup.py' checks it.
+
 NOTE: Django does not generate a *.POT file when extracting translation strings, POT file seem a specific format from Babel, but PO-Project need it, so we use 'django_default_locale' argument to gives a default locale to use to generate the POT file. This locale should be a locale that is not really translated, like the 'en' locale for a webapp using 'en' locale to writes the translation strings sources.
 """
-import datetime, os
-
-from requests.exceptions import HTTPError, ConnectionError, InvalidSchema
+import copy, datetime, os, sys
 
 from argh import arg, ArghParser
 from argh.exceptions import CommandError
 
-from po_projects_client import logging_handler
 from po_projects_client import __version__ as client_version
-from po_projects_client.config import POProjectConfig
-from po_projects_client.client import ProjectDoesNotExistException, PotDoesNotExistException, POProjectClient
 
 
+# Exit status for a pull with '--detailed_exitcode' when nothing has changed
+PULL_UNCHANGED_EXITCODE = 3
+
 # Available common options for all commands
 cmd_user_opt = arg('-u', '--user', default=None, help="Username to connect to the service")
 cmd_password_opt = arg('-p', '--password', default=None, help="Password to connect to the service")
@@ -25,10 +25,42 @@ cmd_config_opt = arg('-c', '--config', default='po_projects.cfg', help="Path to
 cmd_passive_opt = arg('--passive', default=False, action='store_true', help="Disable config saving")
 cmd_loglevel_opt = arg('-l', '--loglevel', default='info', choices=['debug','info','warning','error','critical'], help="The minimal verbosity level to limit logs output")
 cmd_logfile_opt = arg('--logfile', default=None, help="A filepath that if setted, will be used to save logs output")
-cmd_timer_opt = arg('-t', '--timer', default=False, action='store_true', help="Display elapsed time at the end of execution")
+cmd_logfileformat_opt = arg('--logfile_format', default='text', choices=['text','json'], help="Format of the '--logfile' output, 'json' writes a JSON object per line")
+cmd_bufferedlogs_opt = arg('--buffered_logs', default=False, action='store_true', help="Write the logs from a background thread with batched flushes, so verbose logging does not slow down the command")
+cmd_timer_opt = arg('-t', '--timer', default=False, action='store_true', help="Display elapsed time at the end of execution, with the time spent in each phase")
+cmd_metricsfile_opt = arg('--metrics_file', default=None, help="A filepath where to append the timings and counters of each project as a JSON line")
+cmd_poolsize_opt = arg('--pool_size', default=None, type=int, help="Number of keep-alive connections kept in the HTTP session pool (default: 10)")
+cmd_timeout_opt = arg('--timeout', default=None, type=int, help="Timeout in seconds to connect and to wait for service responses (default: 60)")
+cmd_retries_opt = arg('--retries', default=None, type=int, help="Number of retries for an interrupted tarball download (default: 3)")
+cmd_retrybackoff_opt = arg('--retry_backoff', default=None, type=int, help="Base delay in seconds between download retries, doubled on each retry (default: 1)")
+cmd_metadatattl_opt = arg('--metadata_ttl', default=None, type=int, help="Time in seconds the cached project metadata are valid (default: 3600)")
+cmd_refreshmetadata_opt = arg('--refresh_metadata', default=False, action='store_true', help="Fetch again the project metadata instead of using the cached ones")
 cmd_projectslug_opt = arg('--project_slug', default=None, help="Project slug name")
 cmd_localepath_opt = arg('--locale_path', default=None, help="Path to the locale directory")
 cmd_kind_opt = arg('--kind', default='django', help="Kind of message catalog", choices=['django','messages'])
+cmd_chunksize_opt = arg('--chunk_size', default=None, type=int, help="Size in bytes of the blocks read from the tarball stream")
+cmd_locales_opt = arg('--locales', default=None, help="Comma separated names of the locales to pull, the other installed locales are left untouched (default: all)")
+cmd_locktimeout_opt = arg('--lock_timeout', default=None, type=int, help="Maximum time in seconds to wait for another pull into the same locale directory (default: wait until it ends)")
+cmd_compression_opt = arg('--compression', default=None, choices=['gz','xz','bz2','none'], help="Preferred tarball compression to ask the service for, the other available ones are also accepted ('xz' needs the 'backports.lzma' package) (default: gz)")
+cmd_cachedir_opt = arg('--cache_dir', default=None, help="Directory of a tarball cache shared between working copies, a cached tarball is installed without downloading it again if the project has not changed (default: the PO_PROJECTS_CACHE_DIR environment variable if set)")
+cmd_cachesize_opt = arg('--cache_size', default=None, type=int, help="Maximum size in megabytes of the tarball cache, the least recently used tarballs are removed (default: 500)")
+cmd_installmode_opt = arg('--install_mode', default=None, choices=['replace','incremental','rename','symlink'], help="How to install the pulled locale directory, 'incremental' only writes new or changed files, 'rename' and 'symlink' atomically swap the whole directory (default: replace)")
+cmd_keepversions_opt = arg('--keep_versions', default=None, type=int, help="With the 'symlink' install mode, number of locale directory versions to keep (default: 2)")
+cmd_prune_opt = arg('--prune', default=False, action='store_true', help="With the 'incremental' install mode, remove files that are not in the pulled tarball anymore")
+cmd_compile_opt = arg('--compile', default=False, action='store_true', help="Compile the installed catalogs to MO files, using all the CPUs")
+cmd_diff_opt = arg('--diff', default=False, action='store_true', help="Only report the translations added, changed or removed by the project tarball from the installed catalogs, nothing is written")
+cmd_unified_opt = arg('--unified', default=False, action='store_true', help="With '--diff', also output the unified diff of the catalogs")
+cmd_detailedexitcode_opt = arg('--detailed_exitcode', default=False, action='store_true', help="Exit with status {0} when the project has not changed since the last pull".format(PULL_UNCHANGED_EXITCODE))
+cmd_pushmode_opt = arg('--push_mode', default=None, choices=['json','gzip','multipart'], help="How to send the catalog, 'gzip' and 'multipart' need the service to support them (default: json)")
+cmd_domains_opt = arg('--domains', default=None, help="Comma separated gettext domains to push, or 'all' for every catalog found beside the kind one (default: the kind domain)")
+cmd_sourcedirs_opt = arg('--source_dirs', default=None, help="Comma separated directories of the source files to extract the messages from (default: the current directory)")
+cmd_extract_opt = arg('--extract', default=False, action='store_true', help="Extract the messages of the source files to the catalog before pushing it")
+cmd_force_opt = arg('--force', default=False, action='store_true', help="Push the catalog even if it has not changed since the last push")
+cmd_all_opt = arg('--all', default=False, action='store_true', help="Process every named project section from the config file")
+cmd_jobs_opt = arg('-j', '--jobs', default=4, type=int, help="Maximum number of projects processed concurrently with '--all'")
+cmd_debounce_opt = arg('--debounce', default=2.0, type=float, help="Time in seconds without any change to wait before pushing the catalog")
+cmd_interval_opt = arg('--interval', default=1.0, type=float, help="Time in seconds between checks when inotify is not available")
+cmd_pullback_opt = arg('--pull_back', default=False, action='store_true', help="Pull the project after each push to get the merged catalogs")
 cmd_djangodefaultlocale_opt = arg('--django_default_locale', default=None, help="Default locale used to generate a temporary POT file")
 
 
@@ -38,58 +70,219 @@ class CliInterfaceBase(object):
     
     It takes care of the logging, timer, config and service connection, also embed some common args validate
     """
-    def __init__(self, args):
+    def __init__(self, args, command=None):
         self.args = args
+        self.command = command
+        # Keep the arguments before any config merging for project interfaces
+        self.cli_args = copy.copy(args)
         
         self.config = None
+        self.state = None
+        self.index = None
+        self.extraction_cache = None
         self.con = None
+        self.project_name = None
+        # Shared HTTP session for project interfaces
+        self.session = None
+        # Project interfaces from 'run_all'
+        self.projects = []
         
         self.starttime = datetime.datetime.now()
         # Init, load and builds
-        self.root_logger = logging_handler.init_logging(self.args.loglevel.upper(), logfile=self.args.logfile)
+        from po_projects_client import logging_handler
+        self.root_logger = logging_handler.init_logging(self.args.loglevel.upper(), logfile=self.args.logfile, logfile_format=self.args.logfile_format, buffered=self.args.buffered_logs)
     
     def open_config(self):
+        from po_projects_client.config import POProjectConfig
+        from po_projects_client.state import StateFile
+        from po_projects_client.index import CatalogIndex
+        from po_projects_client.extractor import ExtractionCache
         # Open config file if exists
         self.config = POProjectConfig()
         self.config.open(self.args.config)
-        configdatas = self.config.get_datas()
+        self.merge_config(self.config.get_datas())
+        # State and index files beside the config file
+        self.state = StateFile('{0}.state'.format(os.path.splitext(self.args.config)[0]))
+        self.index = CatalogIndex('{0}.index'.format(os.path.splitext(self.args.config)[0]))
+        self.extraction_cache = ExtractionCache('{0}.extract'.format(os.path.splitext(self.args.config)[0]))
+    
+    def merge_config(self, configdatas):
         # Merge config in arguments for empty argument only
-        for item in POProjectConfig.options:
+        for item in self.config.options:
             if item in configdatas:
                 val = getattr(self.args, item, None) or configdatas[item]
                 setattr(self.args, item, val)
                 self.root_logger.debug("Set config value '%s' to: %s", item, val)
     
-    def save_config(self):
+    def save_config(self, write=True):
         # Save config with current values
         if self.config and not self.args.passive:
             self.root_logger.debug("Saving config")
             values = {}
-            for item in POProjectConfig.options:
-                if hasattr(self.args, item):
+            for item in self.config.options:
+                if hasattr(self.args, item) and item not in self.config.readonly:
                     values[item] = getattr(self.args, item)
             
-            self.config.set_datas(values)
+            self.config.set_datas(values, self.project_name)
+            if write:
+                self.config.save()
+    
+    def project_interface(self, name):
+        """
+        Return a new interface for a named project section of the config
+        
+        It shares the logger and config but has its own arguments (merged with 
+        the project section values) and client
+        """
+        interface = copy.copy(self)
+        interface.args = copy.copy(self.cli_args)
+        interface.con = None
+        interface.project_name = name
+        interface.merge_config(self.config.get_datas(name))
+        return interface
+    
+    def run_all(self, action):
+        """
+        Run the action function for every named project of the config, 
+        concurrently on a bounded thread pool
+        
+        A failing project does not abort the other ones, the config is saved 
+        for succeeded projects then failures raise an error. Return the 
+        results of the succeeded projects.
+        """
+        import threading
+        from multiprocessing.pool import ThreadPool
+        from po_projects_client.logging_handler import set_text_format
+        
+        names = self.config.get_projects()
+        if not names:
+            self.root_logger.error("There is no project section in the config file")
+            raise CommandError('Error exit')
+        
+        # Prefix logs with the project name since they are interleaved
+        set_text_format(self.root_logger, '[%(threadName)s] %(message)s')
+        
+        def run(name):
+            threading.current_thread().name = name
+            interface = self.project_interface(name)
+            try:
+                return name, interface, action(interface), None
+            except Exception as e:
+                if not isinstance(e, CommandError):
+                    self.root_logger.error("%s: %s", type(e).__name__, e)
+                return name, interface, None, e
+        
+        jobs = max(1, min(self.args.jobs, len(names)))
+        self.root_logger.debug("Processing %s projects with %s jobs", len(names), jobs)
+        # Projects share the same connection pool, sized for the jobs, the 
+        # commands without connection options never connect
+        if hasattr(self.args, 'pool_size'):
+            from po_projects_client.session import build_session
+            self.session = build_session(max(jobs, self.args.pool_size or 0))
+        pool = ThreadPool(jobs)
+        try:
+            results = pool.map(run, names)
+        finally:
+            pool.close()
+            pool.join()
+        
+        self.projects = [interface for name, interface, result, error in results]
+        succeeded, failures = [], []
+        for name, interface, result, error in results:
+            if error is None:
+                interface.save_config(write=False)
+                succeeded.append(result)
+                self.root_logger.info("Project '%s': %s", name, result)
+            else:
+                failures.append(name)
+                self.root_logger.error("Project '%s': failed", name)
+        if not self.args.passive:
             self.config.save()
+        
+        self.root_logger.info("%s projects succeeded, %s failed", len(succeeded), len(failures))
+        if failures:
+            raise CommandError('Error exit')
+        return succeeded
     
     def connect(self):
         """
-        Connect to the PO Project API service
+        Open the client for the PO Project API service
+        
+        Service is not requested yet, see ``diagnose`` for the connection check
+        """
+        from po_projects_client.client import POProjectClient
+        
+        metadata_ttl = 0 if self.args.refresh_metadata else self.args.metadata_ttl
+        self.con = POProjectClient(self.args.host, (self.args.user, self.args.password), chunk_size=getattr(self.args, 'chunk_size', None), session=self.session, pool_size=self.args.pool_size, timeout=self.args.timeout, state=self.state, metadata_ttl=metadata_ttl, retries=getattr(self.args, 'retries', None), retry_backoff=getattr(self.args, 'retry_backoff', None), cache=self.get_cache(), compression=getattr(self.args, 'compression', None), lock_timeout=getattr(self.args, 'lock_timeout', None))
+        self.con.connect(dry_run=True)
+    
+    def get_cache(self):
+        """
+        Return the tarball cache from the 'cache_dir' argument or the 
+        environment, None if there is no cache directory
         """
-        # Open client
-        self.con = POProjectClient(self.args.host, (self.args.user, self.args.password))
+        from po_projects_client.cache import TarballCache, CACHE_DIR_ENVVAR
+        
+        cache_dir = getattr(self.args, 'cache_dir', None) or os.environ.get(CACHE_DIR_ENVVAR)
+        if not cache_dir:
+            return None
+        cache_size = getattr(self.args, 'cache_size', None)
+        return TarballCache(cache_dir, max_size=cache_size*1024*1024 if cache_size else None)
+    
+    def diagnose(self, error):
+        """
+        Log a failed request error after checking if the service is reachable
+        """
+        from requests.exceptions import HTTPError, ConnectionError, InvalidSchema, Timeout
         
-        # Connect to the service
         try:
             self.con.connect()
-        except (HTTPError, ConnectionError, InvalidSchema) as e:
-            import traceback
-            top = traceback.extract_stack()[-1]
-            self.root_logger.error("%s: %s", type(e).__name__, e)
-            raise CommandError('Error exit')
+        except (HTTPError, ConnectionError, InvalidSchema, Timeout) as e:
+            self.root_logger.error("Unable to connect to the service: %s: %s", type(e).__name__, e)
+        else:
+            self.root_logger.error("%s: %s", type(error).__name__, error)
+        raise CommandError('Error exit')
+    
+    def get_metrics(self):
+        """
+        Return a list of (project name, metrics) for the clients used by the 
+        command
+        """
+        interfaces = self.projects or [self]
+        return [(item.project_name or item.args.project_slug, item.con.metrics) for item in interfaces if item.con]
+    
+    def write_metrics(self):
+        """
+        Append the metrics of every project to the metrics file as JSON lines
+        """
+        import json, time
+        
+        with open(self.args.metrics_file, 'ab') as fp:
+            for name, metrics in self.get_metrics():
+                datas = metrics.as_dict()
+                datas.update({'time': time.time(), 'command': self.command, 'project': name})
+                fp.write(json.dumps(datas, sort_keys=True)+'\n')
     
     def close(self):
+        if self.state and not self.args.passive:
+            self.state.save()
+        if self.index and not self.args.passive:
+            self.index.save()
+        if self.extraction_cache and not self.args.passive:
+            self.extraction_cache.save()
+        if self.con:
+            self.con.close()
+        if self.session:
+            self.session.close()
+        if getattr(self.args, 'metrics_file', None):
+            self.write_metrics()
         if self.args.timer:
+            for name, metrics in self.get_metrics():
+                self.root_logger.info("Project '%s' in %.3fs", name, metrics.elapsed())
+                for phase, seconds in metrics.ordered_phases():
+                    self.root_logger.info('    %-16s %.3fs', phase, seconds)
+                for counter, value in sorted(metrics.counters.items()):
+                    self.root_logger.info('    %-16s %s', counter, value)
             endtime = datetime.datetime.now()
             self.root_logger.info('Done in %s', str(endtime-self.starttime))
     
@@ -131,37 +324,159 @@ class CliInterfaceBase(object):
 @cmd_passive_opt
 @cmd_loglevel_opt
 @cmd_logfile_opt
+@cmd_logfileformat_opt
+@cmd_bufferedlogs_opt
 @cmd_timer_opt
+@cmd_metricsfile_opt
+@cmd_poolsize_opt
+@cmd_timeout_opt
+@cmd_retries_opt
+@cmd_retrybackoff_opt
+@cmd_metadatattl_opt
+@cmd_refreshmetadata_opt
 @cmd_projectslug_opt
 @cmd_localepath_opt
 @cmd_kind_opt
+@cmd_chunksize_opt
+@cmd_locales_opt
+@cmd_locktimeout_opt
+@cmd_compression_opt
+@cmd_cachedir_opt
+@cmd_cachesize_opt
+@cmd_installmode_opt
+@cmd_prune_opt
+@cmd_keepversions_opt
+@cmd_compile_opt
+@cmd_diff_opt
+@cmd_unified_opt
+@cmd_detailedexitcode_opt
+@cmd_all_opt
+@cmd_jobs_opt
 def pull(args):
     """
     Get the PO tarball
     
     TODO: need to use the 'kind' argument to request the right tarball for django or optimus (changing name for catalog files)
     """
-    interface = CliInterfaceBase(args)
+    interface = CliInterfaceBase(args, command='pull')
     
     interface.open_config()
     
+    if args.all:
+        results = interface.run_all(pull_project)
+    else:
+        results = [pull_project(interface)]
+        interface.save_config()
+    
+    interface.close()
+    
+    if args.detailed_exitcode and 'updated' not in results:
+        sys.exit(PULL_UNCHANGED_EXITCODE)
+
+
+def pull_project(interface):
+    """
+    Pull the tarball for the project of the given interface
+    
+    Return 'updated' or 'unchanged'
+    """
+    if getattr(interface.args, 'diff', False):
+        return diff_project(interface)
+    
+    from requests.exceptions import HTTPError, ConnectionError, InvalidSchema, Timeout
+    from po_projects_client.client import ProjectDoesNotExistException
+    from po_projects_client.compression import UnsupportedCompressionException
+    from po_projects_client.lock import LockTimeoutException
+    from po_projects_client.compiler import compile_catalogs
+    
+    args = interface.args
+    
     interface.validate_authentication_args()
     interface.validate_slug_args()
     interface.validate_locale_path_args()
     
-    interface.connect()
+    # Keep the client of a watching interface
+    if interface.con is None:
+        interface.connect()
+    
+    # Validators from the last successful pull
+    validators = dict([(k, getattr(args, 'tarball_'+k, None)) for k in ('etag', 'last_modified', 'hash')])
+    locales = [item.strip() for item in (args.locales or '').split(',') if item.strip()] or None
     
     # Pull the tarball
     try:
-        project_id, project_slug = interface.con.pull(args.project_slug, args.locale_path, args.kind)
-    except ProjectDoesNotExistException as e:
+        project_id, project_slug = interface.con.pull(args.project_slug, args.locale_path, args.kind, validators=validators, install_mode=args.install_mode or 'replace', prune=args.prune, keep_versions=args.keep_versions or 2, locales=locales)
+    except (ProjectDoesNotExistException, UnsupportedCompressionException, LockTimeoutException) as e:
         interface.root_logger.error(e)
         raise CommandError('Error exit')
+    except (HTTPError, ConnectionError, InvalidSchema, Timeout) as e:
+        interface.diagnose(e)
     else:
         interface.args.project_id, interface.args.project_slug = project_id, project_slug
+        # Empty values so a validator missing from the last response is 
+        # cleared from the config
+        for k,v in interface.con.tarball_validators.items():
+            setattr(interface.args, 'tarball_'+k, v or '')
+        # Installed files are the reference for the local changes
+        if interface.con.installed_hashes:
+            interface.index.set_installed(args.locale_path, interface.con.installed_hashes, locales=locales)
     
-    interface.save_config()
-    interface.close()
+    # Compile the catalogs even if the tarball has not changed, in case some 
+    # MO files are missing or outdated
+    if args.compile:
+        with interface.con.metrics.phase('compile'):
+            summary = compile_catalogs(args.locale_path)
+        if summary['failed']:
+            raise CommandError('Error exit')
+    
+    if interface.con.updated:
+        return 'updated'
+    return 'unchanged'
+
+
+def diff_project(interface):
+    """
+    Compare the project tarball with the installed catalogs of the given 
+    interface, without installing it
+    
+    Return 'updated' if there are some differences, else 'unchanged'
+    """
+    from requests.exceptions import HTTPError, ConnectionError, InvalidSchema, Timeout
+    from po_projects_client.client import ProjectDoesNotExistException
+    from po_projects_client.compression import UnsupportedCompressionException
+    
+    args = interface.args
+    
+    interface.validate_authentication_args()
+    interface.validate_slug_args()
+    interface.validate_locale_path_args()
+    
+    if interface.con is None:
+        interface.connect()
+    
+    locales = [item.strip() for item in (args.locales or '').split(',') if item.strip()] or None
+    
+    try:
+        summary, diff_lines = interface.con.diff(args.project_slug, args.locale_path, args.kind, locales=locales, unified=args.unified)
+    except (ProjectDoesNotExistException, UnsupportedCompressionException) as e:
+        interface.root_logger.error(e)
+        raise CommandError('Error exit')
+    except (HTTPError, ConnectionError, InvalidSchema, Timeout) as e:
+        interface.diagnose(e)
+    
+    changed = False
+    for locale in sorted(summary):
+        counters = summary[locale]
+        interface.root_logger.info("%s: %s added, %s changed, %s removed translations", locale, counters['added'], counters['changed'], counters['removed'])
+        changed = changed or any(counters.values())
+    if diff_lines:
+        sys.stdout.writelines(diff_lines)
+        sys.stdout.flush()
+    
+    if changed or diff_lines:
+        return 'updated'
+    interface.root_logger.info("The installed catalogs are up to date")
+    return 'unchanged'
 
 
 @cmd_user_opt
@@ -171,42 +486,352 @@ def pull(args):
 @cmd_passive_opt
 @cmd_loglevel_opt
 @cmd_logfile_opt
+@cmd_logfileformat_opt
+@cmd_bufferedlogs_opt
 @cmd_timer_opt
+@cmd_metricsfile_opt
+@cmd_poolsize_opt
+@cmd_timeout_opt
+@cmd_metadatattl_opt
+@cmd_refreshmetadata_opt
 @cmd_projectslug_opt
 @cmd_localepath_opt
 @cmd_djangodefaultlocale_opt
+@cmd_pushmode_opt
+@cmd_domains_opt
+@cmd_extract_opt
+@cmd_sourcedirs_opt
+@cmd_force_opt
+@cmd_all_opt
+@cmd_jobs_opt
 def push(args):
     """
     Send the current local POT file
     """
-    interface = CliInterfaceBase(args)
+    interface = CliInterfaceBase(args, command='push')
     
     interface.open_config()
     
+    if args.all:
+        interface.run_all(push_project)
+    else:
+        push_project(interface)
+        interface.save_config()
+    
+    interface.close()
+
+
+def push_project(interface):
+    """
+    Push the POT file for the project of the given interface
+    """
+    from requests.exceptions import HTTPError, ConnectionError, InvalidSchema, Timeout
+    from po_projects_client.client import ProjectDoesNotExistException, PotDoesNotExistException
+    
+    args = interface.args
+    
     interface.validate_authentication_args()
     interface.validate_slug_args()
     interface.validate_locale_path_args()
     
-    interface.connect()
+    # Keep the client of a watching interface
+    if interface.con is None:
+        interface.connect()
+    
+    if getattr(args, 'extract', False):
+        with interface.con.metrics.phase('extract_messages'):
+            extract_project(interface)
+    
+    domains = getattr(args, 'domains', None)
+    if domains == 'all':
+        domains = interface.con.get_domains(args.locale_path, args.kind, args.django_default_locale)
+    elif domains:
+        domains = [item.strip() for item in domains.split(',') if item.strip()]
     
     # Push the POT
     try:
-        interface.con.push(args.project_slug, args.locale_path, args.kind, args.django_default_locale)
+        interface.con.push(args.project_slug, args.locale_path, args.kind, args.django_default_locale, mode=args.push_mode, force=args.force, domains=domains)
     except (ProjectDoesNotExistException, PotDoesNotExistException) as e:
         interface.root_logger.error(e)
         raise CommandError('Error exit')
+    except (HTTPError, ConnectionError, InvalidSchema, Timeout) as e:
+        interface.diagnose(e)
+    
+    if interface.con.pushed:
+        return 'pushed'
+    return 'unchanged'
+
+
+@cmd_config_opt
+@cmd_passive_opt
+@cmd_loglevel_opt
+@cmd_logfile_opt
+@cmd_logfileformat_opt
+@cmd_bufferedlogs_opt
+@cmd_timer_opt
+@cmd_localepath_opt
+@cmd_kind_opt
+@cmd_djangodefaultlocale_opt
+@cmd_sourcedirs_opt
+@cmd_all_opt
+@cmd_jobs_opt
+def extract(args):
+    """
+    Extract the messages of the source files to the catalog to push
+    """
+    interface = CliInterfaceBase(args, command='extract')
+    
+    interface.open_config()
+    
+    if args.all:
+        interface.run_all(extract_project)
+    else:
+        extract_project(interface)
+        interface.save_config()
+    
+    interface.close()
+
+
+def extract_project(interface):
+    """
+    Extract the messages of the source files to the catalog for the project 
+    of the given interface, only the source files changed since the last 
+    extraction are read again
+    
+    Return 'extracted' if the catalog has been written, else 'unchanged'
+    """
+    from po_projects_client.catalog import get_catalog_filepath
+    from po_projects_client.extractor import extract_catalog
+    
+    args = interface.args
+    start = datetime.datetime.now()
+    
+    interface.validate_locale_path_args()
+    if not args.locale_path:
+        interface.root_logger.error("The locale directory path is a required argument")
+        raise CommandError('Error exit')
+    
+    source_dirs = [item.strip() for item in (args.source_dirs or '.').split(',') if item.strip()]
+    for item in source_dirs:
+        if not os.path.isdir(item):
+            interface.root_logger.error("The given source directory path does not exists or is not a directory: %s", item)
+            raise CommandError('Error exit')
+    
+    catalog_filepath = get_catalog_filepath(args.locale_path, args.kind, args.django_default_locale)
+    summary = extract_catalog(source_dirs, catalog_filepath, args.kind, cache=interface.extraction_cache, excludes=[args.locale_path])
+    if summary['failed']:
+        raise CommandError('Error exit')
+    
+    elapsed = datetime.datetime.now()-start
+    interface.root_logger.info("Extracted %(messages)s messages from %(files)s files (%(extracted)s read, %(cached)s cached)", summary)
+    if summary['written']:
+        interface.root_logger.info("Catalog written to %s in %dms", catalog_filepath, elapsed.total_seconds()*1000)
+        return 'extracted'
+    interface.root_logger.info("Catalog is unchanged in %dms", elapsed.total_seconds()*1000)
+    return 'unchanged'
+
+
+@cmd_user_opt
+@cmd_password_opt
+@cmd_host_opt
+@cmd_config_opt
+@cmd_passive_opt
+@cmd_loglevel_opt
+@cmd_logfile_opt
+@cmd_logfileformat_opt
+@cmd_bufferedlogs_opt
+@cmd_timer_opt
+@cmd_metricsfile_opt
+@cmd_poolsize_opt
+@cmd_timeout_opt
+@cmd_retries_opt
+@cmd_retrybackoff_opt
+@cmd_metadatattl_opt
+@cmd_refreshmetadata_opt
+@cmd_projectslug_opt
+@cmd_localepath_opt
+@cmd_kind_opt
+@cmd_djangodefaultlocale_opt
+@cmd_pushmode_opt
+@cmd_debounce_opt
+@cmd_interval_opt
+@cmd_pullback_opt
+@cmd_chunksize_opt
+@cmd_locales_opt
+@cmd_locktimeout_opt
+@cmd_compression_opt
+@cmd_cachedir_opt
+@cmd_cachesize_opt
+@cmd_installmode_opt
+@cmd_prune_opt
+@cmd_keepversions_opt
+@cmd_compile_opt
+def watch(args):
+    """
+    Push the catalog each time it changes, until interrupted with Ctrl+C
+    """
+    from po_projects_client.watcher import get_watcher
+    
+    interface = CliInterfaceBase(args, command='watch')
+    
+    interface.open_config()
+    
+    interface.validate_authentication_args()
+    interface.validate_slug_args()
+    interface.validate_locale_path_args()
+    
+    # The same client is used for every push so its connections are reused
+    interface.connect()
+    # Catalog hashes are compared with the last pushed one
+    args.force = False
+    
+    pot_filepath = interface.con.get_pot_filepath(args.locale_path, args.kind, args.django_default_locale)
+    watcher = get_watcher(pot_filepath, interval=args.interval)
+    interface.root_logger.info("Watching %s with %s, press Ctrl+C to stop", pot_filepath, watcher.name)
+    
+    try:
+        # Push the changes made since the last push
+        watch_sync(interface, watcher, pot_filepath)
+        for change in watcher.changes(debounce=args.debounce):
+            interface.root_logger.debug("Catalog has changed")
+            watch_sync(interface, watcher, pot_filepath)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
     
     interface.save_config()
     interface.close()
 
 
+def watch_sync(interface, watcher, pot_filepath):
+    """
+    Push the watched catalog if it has changed then optionally pull the 
+    project back
+    
+    Errors are logged and don't stop the watching
+    """
+    args = interface.args
+    try:
+        if push_project(interface) == 'pushed' and args.pull_back:
+            pull_project(interface)
+            # The pulled catalog comes from the service, it does not have to 
+            # be pushed back
+            watcher.reset()
+            interface.con.remember_catalog(args.project_slug, args.kind, pot_filepath)
+    except CommandError:
+        interface.root_logger.warning("Waiting for the next change of the catalog")
+    
+    if not args.passive:
+        interface.save_config()
+        interface.state.save()
+
+
+@cmd_user_opt
+@cmd_password_opt
+@cmd_host_opt
+@cmd_config_opt
+@cmd_passive_opt
+@cmd_loglevel_opt
+@cmd_logfile_opt
+@cmd_logfileformat_opt
+@cmd_bufferedlogs_opt
+@cmd_timer_opt
+@cmd_metricsfile_opt
+@cmd_poolsize_opt
+@cmd_timeout_opt
+@cmd_metadatattl_opt
+@cmd_refreshmetadata_opt
+@cmd_projectslug_opt
+@cmd_localepath_opt
+@cmd_kind_opt
+@cmd_locales_opt
+@cmd_all_opt
+@cmd_jobs_opt
+def status(args):
+    """
+    Compare the local catalogs with the remote project, without pulling it
+    """
+    interface = CliInterfaceBase(args, command='status')
+    
+    interface.open_config()
+    
+    if args.all:
+        interface.run_all(status_project)
+    else:
+        status_project(interface)
+        interface.save_config()
+    
+    interface.close()
+
+
+def status_project(interface):
+    """
+    Report the state of the local catalogs for the project of the given 
+    interface
+    
+    Return 'stale' if the remote project has changed since the last pull or 
+    if local catalogs have been modified, else 'up to date'
+    """
+    from requests.exceptions import HTTPError, ConnectionError, InvalidSchema, Timeout
+    from po_projects_client.client import ProjectDoesNotExistException
+    
+    args = interface.args
+    start = datetime.datetime.now()
+    
+    interface.validate_authentication_args()
+    interface.validate_slug_args()
+    if not args.locale_path or not os.path.isdir(args.locale_path):
+        interface.root_logger.error("The given locale directory path does not exists or is not a directory: %s", args.locale_path)
+        raise CommandError('Error exit')
+    
+    interface.connect()
+    
+    # Only the catalogs changed since the last status are parsed
+    parsed = interface.index.update(args.locale_path)
+    locales = interface.index.get_locales(args.locale_path)
+    
+    validators = dict([(k, getattr(args, 'tarball_'+k, None)) for k in ('etag', 'last_modified')])
+    pulled_locales = [item.strip() for item in (args.locales or '').split(',') if item.strip()] or None
+    try:
+        remote = interface.con.check_tarball(args.project_slug, args.kind, validators, locales=pulled_locales)
+    except ProjectDoesNotExistException as e:
+        interface.root_logger.error(e)
+        raise CommandError('Error exit')
+    except (HTTPError, ConnectionError, InvalidSchema, Timeout) as e:
+        interface.diagnose(e)
+    
+    if remote == 'changed':
+        interface.root_logger.info("Remote project has changed since the last pull")
+    elif remote == 'unchanged':
+        interface.root_logger.info("Remote project has not changed since the last pull")
+    else:
+        interface.root_logger.info("Remote project state is unknown, it has not been pulled yet")
+    
+    stale = remote != 'unchanged'
+    for locale, counters in sorted(locales.items()):
+        coverage = counters['translated']*100.0/counters['messages'] if counters['messages'] else 100.0
+        line = "    {0:<10} {1:>6}/{2:<6} translated ({3:.1f}%), {4} fuzzy".format(locale, counters['translated'], counters['messages'], coverage, counters['fuzzy'])
+        if counters['modified'] or counters['missing']:
+            line += ", {0} modified and {1} missing files since the last pull".format(counters['modified'], counters['missing'])
+            stale = True
+        interface.root_logger.info(line)
+    
+    elapsed = datetime.datetime.now()-start
+    interface.root_logger.info("Status of %s locales in %dms (%s catalogs parsed)", len(locales), elapsed.total_seconds()*1000, parsed)
+    
+    if stale:
+        return 'stale'
+    return 'up to date'
+
+
 def main():
     """
     Main entrypoint for console_script (commandline script)
     """
     parser = ArghParser()
     parser.add_argument('-v', '--version', action='version', version=client_version)
-    enabled_commands = [pull, push]
+    enabled_commands = [pull, push, watch, status, extract]
     
     parser.add_commands(enabled_commands)
     parser.dispatch()
@@ -1,13 +1,19 @@
 # -*- coding: utf-8 -*-
-import json, logging, os
-import tarfile, StringIO, tempfile, shutil
+import base64, codecs, difflib, glob, gzip, hashlib, json, logging, os, random, re, socket, time
+import tarfile, tempfile, shutil
+from multiprocessing.pool import ThreadPool
 
-from requests.exceptions import HTTPError
-
-from nap.url import Url
+from requests.exceptions import HTTPError, ConnectionError, ChunkedEncodingError, Timeout
+from requests.packages.urllib3.exceptions import ProtocolError, ReadTimeoutError
 
 from po_projects_client import __version__ as client_version
 from po_projects_client import logging_handler
+from po_projects_client.lock import InstallLock
+from po_projects_client.compression import accept_header, available_compressions, DecompressingReader
+from po_projects_client.catalog import catalog_hash, get_catalog_filepath, read_po, get_translations, compare_translations
+from po_projects_client.metrics import Metrics
+from po_projects_client.session import build_session, ServiceUrl
+from po_projects_client.installer import staging_dir, file_hash, carry_over, replace_install, incremental_install, rename_install, symlink_install
 
 class ProjectDoesNotExistException(HTTPError):
     pass
@@ -15,6 +21,47 @@ class ProjectDoesNotExistException(HTTPError):
 class PotDoesNotExistException(HTTPError):
     pass
 
+class IncompleteTarballException(HTTPError):
+    pass
+
+class TransientResponseException(HTTPError):
+    pass
+
+# Errors worth to retry a download for
+TRANSIENT_ERRORS = (ConnectionError, ChunkedEncodingError, Timeout, ProtocolError, ReadTimeoutError, socket.error, TransientResponseException, IncompleteTarballException)
+
+# Checksum algorithms from the 'Digest' response header
+DIGEST_ALGORITHMS = {'sha-256': hashlib.sha256, 'sha': hashlib.sha1, 'md5': hashlib.md5}
+
+def write_json_pot(infile, outfile, compress=False, chunk_size=64*1024):
+    """
+    Write the JSON push body (``{"pot": "..."}``) for the catalog content from 
+    infile to outfile, chunk by chunk so the catalog is never fully loaded
+    
+    @compress arg to gzip the written body
+    
+    Return the size of the uncompressed body
+    """
+    if compress:
+        outfile = gzip.GzipFile(fileobj=outfile, mode='wb')
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    
+    datas = '{"pot": "'
+    outfile.write(datas)
+    size = len(datas)
+    for chunk in iter(lambda: infile.read(chunk_size), ''):
+        # Escape the chunk like a JSON string without its quotes
+        datas = json.dumps(decoder.decode(chunk))[1:-1]
+        outfile.write(datas)
+        size += len(datas)
+    datas = json.dumps(decoder.decode('', final=True))[1:-1]+'"}'
+    outfile.write(datas)
+    size += len(datas)
+    
+    if compress:
+        outfile.close()
+    return size
+
 class POProjectClient(object):
     """
     THE client
@@ -33,20 +80,103 @@ class POProjectClient(object):
     project_id = None
     project_slug = None
     project_tarball_url = None
+    project_domains = None
+    
+    updated = False
+    tarball_validators = {}
+    install_summary = None
     
-    def __init__(self, root_url, auth_settings, debug_requests=True):
+    install_modes = ('replace', 'incremental', 'rename', 'symlink')
+    # The 'gzip' and 'multipart' modes need the service to support them
+    push_modes = ('json', 'gzip', 'multipart')
+    default_push_mode = 'json'
+    installed_hashes = None
+    push_stats = None
+    push_results = None
+    pushed = False
+    
+    # Default size (in bytes) of the blocks read from the tarball stream
+    default_chunk_size = 64*1024
+    # Default number of keep-alive connections in the session pool
+    default_pool_size = 10
+    # Default timeout in seconds to connect and to wait for response datas
+    default_timeout = 60
+    # Default time in seconds the cached project metadata are valid
+    default_metadata_ttl = 3600
+    # Default number of retries for an interrupted tarball download
+    default_retries = 3
+    # Default base delay in seconds between retries, doubled on each retry
+    default_retry_backoff = 1
+    # Maximum delay in seconds between retries
+    max_retry_delay = 60
+    
+    def __init__(self, root_url, auth_settings, debug_requests=True, chunk_size=None, session=None, pool_size=None, timeout=None, state=None, metadata_ttl=None, retries=None, retry_backoff=None, cache=None, compression=None, lock_timeout=None):
+        """
+        @session arg is an optional ``requests.Session`` to share between 
+        clients, if not given the client build its own one with a pool of 
+        @pool_size connections
+        
+        @state arg is an optional StateFile where project metadata are cached 
+        for @metadata_ttl seconds, a zero ttl always fetch them again
+        
+        @retries arg is the number of times an interrupted tarball download 
+        is retried, waiting @retry_backoff seconds (doubled on each retry)
+        
+        @cache arg is an optional TarballCache where the downloaded tarballs 
+        are stored, to be installed again without downloading them
+        
+        @compression arg is the preferred tarball compression ('gz', 'xz', 
+        'bz2' or 'none'), the other available ones are also accepted
+        
+        @lock_timeout arg is the maximum time in seconds a pull waits for 
+        another pull into the same directory, None to wait forever
+        """
         self.logger = logging.getLogger('po_projects_client')
         
         self.root_url = root_url
         self.auth_settings = auth_settings
         
         self.debug_requests = debug_requests
+        self.chunk_size = chunk_size or self.default_chunk_size
+        self.timeout = timeout or self.default_timeout
+        self.retries = self.default_retries if retries is None else retries
+        self.retry_backoff = self.default_retry_backoff if retry_backoff is None else retry_backoff
+        
+        self._own_session = session is None
+        self.session = session or build_session(pool_size or self.default_pool_size)
+        
+        self.state = state
+        self.metadata_ttl = self.default_metadata_ttl if metadata_ttl is None else metadata_ttl
+        self.metadata_cached = False
+        self.cache = cache
+        if compression and compression not in available_compressions():
+            self.logger.warning("The '%s' compression is not available, using the default one", compression)
+            compression = None
+        self.compression = compression
+        self.lock_timeout = lock_timeout
+        
+        # Timings and counters of the client operations
+        self.metrics = Metrics()
+    
+    def get_url(self, url, **kwargs):
+        """
+        Return a ServiceUrl for the given url, authenticated and requested 
+        through the client session
+        """
+        return ServiceUrl(url, self.session, auth=self.auth_settings, timeout=self.timeout, **kwargs)
+    
+    def close(self):
+        """
+        Close the session connections if the client owns it
+        """
+        if self._own_session:
+            self.session.close()
     
     def connect(self, dry_run=False):
         """
         Connecting to endpoints
         """
-        self.api_base = Url(self.root_url, auth=self.auth_settings)
+        self.api_base = self.get_url(self.root_url)
         
         self.api_endpoint_projects = self.api_base.join(self.endpoint_projects_path)
         self.api_endpoint_projectcurrent = self.api_base.join(self.endpoint_projectcurrent_path)
@@ -54,70 +184,295 @@ class POProjectClient(object):
         # Trying to connect to the base to check if the service is reachable
         if not dry_run:
             self.logger.info("Connecting to PO-Projects service on: %s", self.root_url)
-            response = self.api_base.get()
+            with self.metrics.phase('connect'):
+                response = self.api_base.get()
             if response.status_code != 200:
                 response.raise_for_status()
             #self.map_projects()
             
         self._connected = True
     
-    def get_project(self, slug):
+    def get_project(self, slug, refresh=False):
         """
         Try to get the project details to see if it exists
+        
+        Details are taken from the metadata cache if any and still valid, 
+        unless @refresh arg is True
         """
         self.project_detail_url = self.api_endpoint_projectcurrent.join('{0}/'.format(slug))
-        response = self.project_detail_url.get()#.json()
-        if response.status_code == 404:
-            raise ProjectDoesNotExistException("Project with slug '{0}' does not exist.".format(slug))
-        elif response.status_code != 200:
-            response.raise_for_status()
+        cache_key = '{0}|{1}'.format(self.root_url, slug)
+        
+        datas = None
+        if self.state is not None and not refresh:
+            datas = self.state.get('metadata', cache_key)
+            if datas and time.time() - datas['time'] > self.metadata_ttl:
+                datas = None
+        self.metadata_cached = bool(datas)
+        
+        if datas:
+            self.logger.debug("Using cached metadata for project: %s", slug)
+        else:
+            with self.metrics.phase('metadata'):
+                response = self.project_detail_url.get()#.json()
+            if response.status_code == 404:
+                raise ProjectDoesNotExistException("Project with slug '{0}' does not exist.".format(slug))
+            elif response.status_code != 200:
+                response.raise_for_status()
+            
+            datas = response.json()
+            if self.state is not None:
+                self.state.set('metadata', cache_key, {
+                    'id': datas['id'],
+                    'slug': datas['slug'],
+                    'tarball_url': datas['tarball_url'],
+                    'domains': datas.get('domains'),
+                    'time': time.time(),
+                })
         
-        datas = response.json()
         self.project_id = datas['id']
         self.project_slug = datas['slug']
         self.project_tarball_url = datas['tarball_url']
+        # Gettext domains the service accepts a catalog for, if it tells them
+        self.project_domains = datas.get('domains')
  
-    def pull(self, slug, destination, kind, commit=True):
+    def pull(self, slug, destination, kind, commit=True, validators=None, install_mode='replace', prune=False, keep_versions=2, locales=None):
         """
         Get the tarball to install updated PO files
         
         @commit arg to effectively install PO files or not
+        
+        @install_mode arg is one of:
+        
+        * 'replace' to remove the previous locale dir then move the new one;
+        * 'incremental' to only write new or changed files, @prune arg enable 
+          the removing of files that are not in the tarball anymore (compiled 
+          catalogs are always keeped);
+        * 'rename' to swap the new locale dir in place with a rename;
+        * 'symlink' to install the new locale dir as a version directory and 
+          flip the destination symlink to it, @keep_versions arg is the number 
+          of versions to keep.
+        
+        @validators arg is an optional dict of the validators from the last 
+        successful pull ('etag', 'last_modified' and 'hash' items), they are 
+        used to skip the download and install when the tarball has not changed.
+        
+        @locales arg is an optional list of the locale names to pull, the 
+        filter is given to the service and applied again on the tarball 
+        members so the other locales are never extracted. The other locale 
+        directories already installed are left untouched.
+        
+        With a tarball cache, when there are no installed validators to send, 
+        the ones of the cached tarball are sent instead and it is installed 
+        if the service answers it has not changed.
+        
+        When installing, the pull holds a lock on the destination. A pull 
+        which had to wait for an identical pull (same service, project, kind 
+        and locales) reuses its result instead of downloading the tarball 
+        again.
+        
+        After the pull, 'updated' attribute tells if the tarball has been 
+        installed, 'tarball_validators' contains the validators to keep for 
+        the next pull and 'installed_hashes' the SHA1 of the installed files 
+        (by path relative to the destination).
         """
+        if install_mode not in self.install_modes:
+            raise ValueError("Invalid install mode: {0}".format(install_mode))
+        validators = validators or {}
+        self.updated = False
+        self.install_summary = None
+        self.installed_hashes = None
+        self.tarball_validators = dict([(k, validators.get(k)) for k in ('etag', 'last_modified', 'hash')])
+        
+        if not commit:
+            # Without the install lock, the tarball is spooled to a unique 
+            # file so concurrent pulls never write to the same one
+            fd, partial_filepath = tempfile.mkstemp(prefix='.', suffix='.tarball.part')
+            os.close(fd)
+            try:
+                return self._pull(slug, destination, kind, commit, validators, install_mode, prune, keep_versions, locales, partial_filepath)
+            finally:
+                self.remove_partial(partial_filepath)
+        
+        name = os.path.basename(os.path.abspath(destination))
+        lock = InstallLock(os.path.join(staging_dir(destination), '.{0}.lock'.format(name)), timeout=self.lock_timeout)
+        key = '|'.join([self.root_url, slug, kind, ','.join(sorted(locales or []))])
+        # The tarball is spooled to a partial file beside the destination, so 
+        # an interrupted pull of the same tarball can be resumed by the next one
+        partial_filepath = os.path.join(staging_dir(destination), '.{0}.{1}.{2}.tarball.part'.format(name, kind, hashlib.sha1(key).hexdigest()[:12]))
+        with lock:
+            result = lock.read_result(key)
+            if result:
+                self.logger.info("Reusing the pull made meanwhile into the same directory")
+                self.metrics.count('coalesced')
+                self.project_id, self.project_slug = result['project_id'], result['project_slug']
+                self.tarball_validators = result['tarball_validators']
+                self.installed_hashes = result['installed_hashes']
+                return self.project_id, self.project_slug
+            
+            self._pull(slug, destination, kind, commit, validators, install_mode, prune, keep_versions, locales, partial_filepath)
+            lock.write_result(key, {
+                'project_id': self.project_id,
+                'project_slug': self.project_slug,
+                'tarball_validators': self.tarball_validators,
+                'installed_hashes': self.installed_hashes,
+            })
+        return self.project_id, self.project_slug
+    
+    def _pull(self, slug, destination, kind, commit, validators, install_mode, prune, keep_versions, locales, partial_filepath):
         self.logger.debug("Downloading the tarball")
         # Get project datas
         self.get_project(slug)
         
-        tarball_url = Url(self.project_tarball_url, params={'kind': kind}, auth=self.auth_settings)
+        # Validators are only relevant if the previously installed locale dir 
+        # is still there, with the requested locales
+        installed = os.path.exists(destination) and all([os.path.isdir(os.path.join(destination, item)) for item in locales or []])
+        headers = {}
+        if installed:
+            if validators.get('etag'):
+                headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                headers['If-Modified-Since'] = validators['last_modified']
+        
+        cached_ref = None
+        if self.cache is not None:
+            cache_key = self.cache.get_key(self.root_url, slug, kind, locales)
+            if not headers:
+                cached_ref = self.cache.get(cache_key)
+            if cached_ref:
+                if cached_ref.get('etag'):
+                    headers['If-None-Match'] = cached_ref['etag']
+                if cached_ref.get('last_modified'):
+                    headers['If-Modified-Since'] = cached_ref['last_modified']
+                if not headers:
+                    cached_ref = None
+        
+        headers['Accept'] = accept_header(self.compression)
+        
+        params = {'kind': kind}
+        if locales:
+            params['locales'] = ','.join(locales)
+        tarball_url = self.get_url(self.project_tarball_url, params=params)
         # Get the tarball
-        response = tarball_url.get(stream=True)
-                
-        # Get a temporary directory
-        tmpdir = tempfile.mkdtemp(suffix='_po-projects-client')
-        
-        self.logger.debug("Opening the tarball")
-        # Write the tarball in memory
-        fp = StringIO.StringIO()
-        for chunk in response.iter_content(1024):
-            fp.write(chunk)
-        fp.seek(0)
-        
-        # Extract the file to the temp directory
-        tar = tarfile.open(fileobj=fp)
-        tar.extractall(path=tmpdir)
-        tar.close()
-        fp.close()
+        with self.metrics.phase('download'):
+            status, download = self.download_tarball(tarball_url, headers, partial_filepath)
+        if status == 404 and self.metadata_cached:
+            # Cached tarball url may be outdated, try again with fresh metadata
+            self.logger.debug("Tarball not found, refreshing the project metadata")
+            self.metrics.count('retries')
+            self.get_project(slug, refresh=True)
+            tarball_url = self.get_url(self.project_tarball_url, params=params)
+            with self.metrics.phase('download'):
+                status, download = self.download_tarball(tarball_url, headers, partial_filepath)
+        tarball_file = None
+        if status == 304 and cached_ref:
+            tarball_file = self.cache.open(cached_ref)
+            if tarball_file is None:
+                # Evicted by another process in the meantime
+                self.logger.debug("Cached tarball has been removed, downloading it")
+                with self.metrics.phase('download'):
+                    status, download = self.download_tarball(tarball_url, {'Accept': headers['Accept']}, partial_filepath)
+            else:
+                self.remove_partial(partial_filepath)
+                self.logger.info("Tarball has not changed, installing it from the cache")
+                self.metrics.count('cache_hits')
+                download = dict([(k, cached_ref.get(k)) for k in ('etag', 'last_modified', 'encoding')])
+                tarball_hash = cached_ref['hash']
+        if status == 304 and tarball_file is None:
+            self.remove_partial(partial_filepath)
+            self.logger.info("Tarball has not changed since the last pull, nothing to do")
+            return self.project_id, self.project_slug
+        if status == 404:
+            raise HTTPError("Tarball not found for project '{0}'".format(slug))
+        
+        if tarball_file is None:
+            tarball_hash = file_hash(partial_filepath, chunk_size=self.chunk_size)
+            if self.cache is not None:
+                self.cache.put(cache_key, partial_filepath, tarball_hash, dict([(k, download[k]) for k in ('etag', 'last_modified', 'encoding')]))
+        
+        response_validators = {
+            'etag': download['etag'],
+            'last_modified': download['last_modified'],
+            'hash': tarball_hash,
+        }
+        # Nothing to extract nor install if the content has not changed
+        if installed and response_validators['hash'] == validators.get('hash'):
+            if tarball_file is not None:
+                tarball_file.close()
+            self.remove_partial(partial_filepath)
+            self.tarball_validators = response_validators
+            self.logger.info("Tarball content is identical to the last pull, nothing to do")
+            return self.project_id, self.project_slug
         
+        # Get a temporary directory, beside the destination when installing so 
+        # the install moves are renames on the same filesystem
         if commit:
-            self.logger.debug("Installing the tarball")
-            # Remove the previous locale dir if any
-            if os.path.exists(destination):
-                shutil.rmtree(destination)
+            tmpdir = tempfile.mkdtemp(prefix='.', suffix='_po-projects-client', dir=staging_dir(destination))
+        else:
+            tmpdir = tempfile.mkdtemp(suffix='_po-projects-client')
+        
+        try:
+            if tarball_file is None:
+                tarball_file = open(partial_filepath, 'rb')
+            self.metrics.count('tarball_bytes', os.fstat(tarball_file.fileno()).st_size)
             
-            # Put the new locale dir
-            shutil.move(os.path.join(tmpdir, 'locale'), destination)
-       
-        # Remove the temp dir
-        os.removedirs(tmpdir)
+            self.logger.debug("Extracting the tarball (chunk size: %s)", self.chunk_size)
+            start = time.time()
+            try:
+                with tarball_file as fp:
+                    # The spooled file keeps the HTTP content encoding so the resumed 
+                    # ranges match, tarfile must only see the archive bytes
+                    if download['encoding'] in ('gzip', 'x-gzip'):
+                        fileobj = gzip.GzipFile(fileobj=fp, mode='rb')
+                    else:
+                        fileobj = fp
+                    # The archive is decompressed block by block while it is extracted
+                    fileobj = DecompressingReader(fileobj, chunk_size=self.chunk_size)
+                    self.logger.debug("Tarball compression: %s", fileobj.compression)
+                    write_time = self.extract_tarball(fileobj, tmpdir, locales=locales)
+            except:
+                # A complete but unreadable download must not be resumed by the 
+                # next pull
+                self.remove_partial(partial_filepath)
+                raise
+            self.remove_partial(partial_filepath)
+            # Disk reads, decompression and file writes are interleaved, the 
+            # decompression time is what remains from the other ones
+            self.metrics.add_time('decompress', time.time()-start-write_time)
+            self.metrics.add_time('extract', write_time)
+            
+            if locales:
+                missing = [item for item in locales if not os.path.isdir(os.path.join(tmpdir, 'locale', item))]
+                if missing:
+                    self.logger.warning("Locales not found in the tarball: %s", ', '.join(missing))
+                if not os.path.isdir(os.path.join(tmpdir, 'locale')):
+                    os.makedirs(os.path.join(tmpdir, 'locale'))
+            
+            if commit:
+                self.logger.debug("Installing the tarball (mode: %s)", install_mode)
+                install_start = time.time()
+                if locales and install_mode != 'incremental':
+                    # The whole directory is swapped, it must contain the locales 
+                    # that have not been pulled
+                    carry_over(destination, os.path.join(tmpdir, 'locale'), locales)
+                if install_mode == 'incremental':
+                    self.install_summary = incremental_install(os.path.join(tmpdir, 'locale'), destination, prune=prune, locales=locales)
+                    self.updated = any([self.install_summary[k] for k in ('added', 'changed', 'removed')])
+                elif install_mode == 'rename':
+                    rename_install(os.path.join(tmpdir, 'locale'), destination)
+                    self.updated = True
+                elif install_mode == 'symlink':
+                    symlink_install(os.path.join(tmpdir, 'locale'), destination, keep_versions=keep_versions)
+                    self.updated = True
+                else:
+                    replace_install(os.path.join(tmpdir, 'locale'), destination)
+                    self.updated = True
+                
+                self.tarball_validators = response_validators
+                self.installed_hashes = dict([(os.path.relpath(k, 'locale'), v) for k,v in self.member_hashes.items()])
+                self.metrics.add_time('install', time.time()-install_start)
+        finally:
+            # Remove the temp dir, also after a failed install
+            shutil.rmtree(tmpdir, ignore_errors=True)
         
         if commit:
             self.logger.info("Succeed to install the tarball to: %s", destination)
@@ -126,34 +481,495 @@ class POProjectClient(object):
         
         return self.project_id, self.project_slug
  
-    def push(self, slug, locale_path, kind, django_default_locale=None, commit=True):
+    def download_tarball(self, tarball_url, headers, filepath):
+        """
+        Download the tarball to the given partial file
+        
+        Transient errors (connection errors, timeouts, 5xx responses and 
+        truncated bodies) are retried with a jittered exponential backoff. An 
+        interrupted download is resumed with a 'Range' request if the service 
+        supports it, the partial file infos are keeped in a '.json' file beside 
+        it so the next pull can resume it too.
+        
+        The downloaded file is verified with its expected length and, if the 
+        service gives one, its checksum.
+        
+        Return a tuple of the final response status and the download infos 
+        ('etag', 'last_modified' and 'encoding' of the tarball), the infos are 
+        None unless the status is 200.
+        """
+        infos = self.read_partial_infos(filepath)
+        attempt = 0
+        while True:
+            try:
+                status, infos = self.download_tarball_attempt(tarball_url, headers, filepath, infos)
+                if status != 200:
+                    return status, None
+                self.verify_tarball(filepath, infos)
+                return status, infos
+            except TRANSIENT_ERRORS as e:
+                attempt += 1
+                if attempt > self.retries:
+                    raise
+                # Exponential delay with a random part so concurrent clients 
+                # don't retry at the same time
+                delay = min(self.retry_backoff*2**(attempt-1), self.max_retry_delay)
+                delay = delay/2.0+random.uniform(0, delay/2.0)
+                self.logger.warning("Tarball download failed (%s: %s), retrying in %.1fs (%s/%s)", type(e).__name__, e, delay, attempt, self.retries)
+                self.metrics.count('retries')
+                time.sleep(delay)
+                infos = self.read_partial_infos(filepath)
+    
+    def download_tarball_attempt(self, tarball_url, headers, filepath, infos):
+        """
+        Make a single tarball request and write its body to the partial file
+        
+        Return the response status and the download infos
+        """
+        request_headers = dict(headers)
+        offset = 0
+        if infos and infos.get('validator'):
+            offset = os.path.getsize(filepath)
+            request_headers['Range'] = 'bytes={0}-'.format(offset)
+            # Only resume if the tarball has not changed in the meantime
+            request_headers['If-Range'] = infos['validator']
+            self.logger.debug("Resuming the tarball download at byte %s", offset)
+        
+        response = tarball_url.get(stream=True, headers=request_headers)
+        try:
+            if response.status_code == 416 and offset:
+                # The partial file is already complete or bigger than the 
+                # tarball, it is downloaded again from the start
+                self.logger.debug("Service refused to resume at byte %s, downloading the whole tarball", offset)
+                self.remove_partial(filepath)
+                response.close()
+                return self.download_tarball_attempt(tarball_url, headers, filepath, None)
+            if response.status_code >= 500:
+                raise TransientResponseException("Service responded with a {0} status".format(response.status_code), response=response)
+            if response.status_code in (304, 404):
+                return response.status_code, None
+            if response.status_code not in (200, 206):
+                response.raise_for_status()
+                raise HTTPError("Unexpected response status: {0}".format(response.status_code), response=response)
+            
+            content_range = re.match(r'bytes (\d+)-\d+/(\d+|\*)', response.headers.get('content-range') or '')
+            if response.status_code == 206:
+                if not content_range or int(content_range.group(1)) != offset:
+                    self.remove_partial(filepath)
+                    raise IncompleteTarballException("Service responded with an unexpected range: {0}".format(response.headers.get('content-range')))
+                mode = 'ab'
+                if content_range.group(2) != '*':
+                    infos['length'] = int(content_range.group(2))
+            else:
+                # Full content, the previous partial content is dropped
+                mode = 'wb'
+                offset = 0
+                length = response.headers.get('content-length')
+                digest = response.headers.get('digest')
+                if not digest and response.headers.get('content-md5'):
+                    digest = 'md5='+response.headers['content-md5']
+                infos = {
+                    'etag': response.headers.get('etag'),
+                    'last_modified': response.headers.get('last-modified'),
+                    'encoding': response.headers.get('content-encoding'),
+                    'length': int(length) if length else None,
+                    'digest': digest,
+                }
+                # Weak ETags can not be used for range requests
+                etag = infos['etag'] if infos['etag'] and not infos['etag'].startswith('W/') else None
+                infos['validator'] = etag or infos['last_modified']
+            self.write_partial_infos(filepath, infos)
+            
+            # Keep the body as sent so it matches the requested ranges
+            response.raw.decode_content = False
+            with open(filepath, mode) as fp:
+                for chunk in iter(lambda: response.raw.read(self.chunk_size), ''):
+                    fp.write(chunk)
+            return 200, infos
+        finally:
+            response.close()
+    
+    def verify_tarball(self, filepath, infos):
+        """
+        Check the downloaded tarball size and checksum
+        
+        A truncated file raise an IncompleteTarballException so the download is 
+        resumed, a corrupted one is removed before raising it.
+        """
+        size = os.path.getsize(filepath)
+        if infos.get('length') is not None and size < infos['length']:
+            raise IncompleteTarballException("Tarball is truncated ({0}/{1} bytes)".format(size, infos['length']))
+        if infos.get('length') is not None and size > infos['length']:
+            self.remove_partial(filepath)
+            raise IncompleteTarballException("Tarball is bigger than expected ({0}/{1} bytes)".format(size, infos['length']))
+        
+        for item in (infos.get('digest') or '').split(','):
+            algorithm, _, value = item.strip().partition('=')
+            if algorithm.lower() not in DIGEST_ALGORITHMS:
+                continue
+            digest = DIGEST_ALGORITHMS[algorithm.lower()]()
+            with open(filepath, 'rb') as fp:
+                for chunk in iter(lambda: fp.read(self.chunk_size), ''):
+                    digest.update(chunk)
+            if base64.b64encode(digest.digest()) != value:
+                self.remove_partial(filepath)
+                raise IncompleteTarballException("Tarball {0} checksum does not match".format(algorithm))
+            self.logger.debug("Tarball %s checksum verified", algorithm)
+    
+    def read_partial_infos(self, filepath):
+        """
+        Return the infos of a partial download, if it can be resumed
+        """
+        if not os.path.exists(filepath) or not os.path.exists(filepath+'.json'):
+            return None
+        try:
+            with open(filepath+'.json', 'rb') as fp:
+                return json.load(fp)
+        except ValueError:
+            return None
+    
+    def write_partial_infos(self, filepath, infos):
+        with open(filepath+'.json', 'wb') as fp:
+            json.dump(infos, fp)
+    
+    def remove_partial(self, filepath):
+        for item in (filepath, filepath+'.json'):
+            if os.path.exists(item):
+                os.remove(item)
+    
+    def diff(self, slug, destination, kind, locales=None, unified=False):
+        """
+        Compare the catalogs of the project tarball with the installed ones, 
+        message by message, without writing anything
+        
+        The tarball is read from the response stream and its catalogs are 
+        parsed in memory. @locales arg is an optional list of the locale names 
+        to compare.
+        
+        Return a dict of counters for the 'added', 'changed' and 'removed' 
+        translations of each locale, and a list of the unified diff lines 
+        between the installed and pulled catalogs if @unified arg is True
+        """
+        self.get_project(slug)
+        params = {'kind': kind}
+        if locales:
+            params['locales'] = ','.join(locales)
+        tarball_url = self.get_url(self.project_tarball_url, params=params)
+        with self.metrics.phase('request'):
+            response = tarball_url.get(stream=True, headers={'Accept': accept_header(self.compression)})
+        if response.status_code != 200:
+            response.close()
+            response.raise_for_status()
+            raise HTTPError("Unexpected response status: {0}".format(response.status_code), response=response)
+        
+        summary, diff_lines, seen = {}, [], set([])
+        def compare(path, new_content):
+            locale = path.split(os.sep)[0]
+            filepath = os.path.join(destination, path)
+            old_content = ''
+            if os.path.exists(filepath):
+                with open(filepath, 'rb') as fp:
+                    old_content = fp.read()
+            counters = compare_translations(get_translations(read_po(old_content.splitlines(True))), get_translations(read_po(new_content.splitlines(True))))
+            totals = summary.setdefault(locale, {'added': 0, 'changed': 0, 'removed': 0})
+            for k,v in counters.items():
+                totals[k] += v
+            if unified and old_content != new_content:
+                diff_lines.extend(difflib.unified_diff(old_content.splitlines(True), new_content.splitlines(True), 'a/'+path, 'b/'+path))
+        
+        # Let urllib3 decode any HTTP content encoding so tarfile only sees 
+        # the archive bytes
+        response.raw.decode_content = True
+        with self.metrics.phase('diff'):
+            tar = tarfile.open(fileobj=DecompressingReader(response.raw, chunk_size=self.chunk_size), mode='r|', bufsize=self.chunk_size)
+            for member in tar:
+                name = os.path.normpath(member.name)
+                parts = name.split(os.sep)
+                if not member.isfile() or not name.endswith('.po') or len(parts) < 3 or parts[0] != 'locale':
+                    continue
+                if locales is not None and parts[1] not in locales:
+                    continue
+                path = os.sep.join(parts[1:])
+                seen.add(path)
+                compare(path, tar.extractfile(member).read())
+                self.metrics.count('tarball_bytes', member.size)
+            tar.close()
+            response.close()
+            
+            # Installed catalogs that are not in the tarball anymore
+            for filepath in glob.glob(os.path.join(destination, '*', 'LC_MESSAGES', '*.po')):
+                path = os.path.relpath(filepath, destination)
+                if path not in seen and (locales is None or path.split(os.sep)[0] in locales):
+                    compare(path, '')
+        
+        return summary, diff_lines
+    
+    def check_tarball(self, slug, kind, validators=None, locales=None):
+        """
+        Check if the project tarball has changed since the last pull, without 
+        downloading it
+        
+        @validators arg is the dict of the validators from the last pull 
+        ('etag' and 'last_modified' items), @locales the list of the pulled 
+        locales since the validators are the ones of their tarball
+        
+        Return 'unchanged', 'changed' or 'unknown' if there is no validator 
+        to compare with
+        """
+        validators = validators or {}
+        if not validators.get('etag') and not validators.get('last_modified'):
+            return 'unknown'
+        self.get_project(slug)
+        
+        # The ETag can depend on the negotiated compression
+        headers = {'Accept': accept_header(self.compression)}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+        params = {'kind': kind}
+        if locales:
+            params['locales'] = ','.join(locales)
+        tarball_url = self.get_url(self.project_tarball_url, params=params)
+        with self.metrics.phase('request'):
+            response = tarball_url.head(headers=headers)
+            if response.status_code in (405, 501):
+                # HEAD is not supported, the body of a GET is never read
+                response = tarball_url.get(headers=headers, stream=True)
+                response.close()
+        
+        if response.status_code == 304:
+            return 'unchanged'
+        if response.status_code != 200:
+            response.raise_for_status()
+        if validators.get('etag') and response.headers.get('etag') == validators['etag']:
+            return 'unchanged'
+        if not validators.get('etag') and response.headers.get('last-modified') == validators['last_modified']:
+            return 'unchanged'
+        return 'changed'
+    
+    def extract_tarball(self, fileobj, path, locales=None):
+        """
+        Extract the regular files from a tarball stream to the given path
+        
+        Members with an absolute path or going out of the given path are 
+        ignored, so are the members from other locales than the given 
+        @locales list if any. The SHA1 of the extracted files are keeped in the 
+        'member_hashes' attribute.
+        
+        Return the time spent to write the files
+        """
+        write_time = 0.0
+        self.member_hashes = {}
+        tar = tarfile.open(fileobj=fileobj, mode='r|*', bufsize=self.chunk_size)
+        for member in tar:
+            if not member.isfile():
+                continue
+            name = os.path.normpath(member.name)
+            if os.path.isabs(name) or name.split(os.sep)[0] == os.pardir:
+                self.logger.warning("Ignored unsafe tarball member: %s", member.name)
+                continue
+            # Members are like 'locale/<locale>/LC_MESSAGES/<domain>.po'
+            parts = name.split(os.sep)
+            if locales is not None and (len(parts) < 3 or parts[1] not in locales):
+                self.metrics.count('skipped_files')
+                continue
+            
+            target = os.path.join(path, name)
+            if not os.path.isdir(os.path.dirname(target)):
+                os.makedirs(os.path.dirname(target))
+            source = tar.extractfile(member)
+            digest = hashlib.sha1()
+            with open(target, 'wb') as outfile:
+                for chunk in iter(lambda: source.read(self.chunk_size), ''):
+                    digest.update(chunk)
+                    start = time.time()
+                    outfile.write(chunk)
+                    write_time += time.time()-start
+            self.member_hashes[name] = digest.hexdigest()
+            self.metrics.count('extracted_files')
+            self.metrics.count('extracted_bytes', member.size)
+        tar.close()
+        return write_time
+    
+    def push(self, slug, locale_path, kind, django_default_locale=None, commit=True, mode=None, force=False, domains=None):
         """
         Send the current locale POT file to the service to trigger the 
         project catalogs update from the given POT
         
         @commit arg to effectively install PO files or not
+        
+        @mode arg is one of 'json' (default), 'gzip' (compressed JSON) or 
+        'multipart' (file upload), the last two ones are only to use with a 
+        service which supports them
+        
+        @domains arg is an optional list of the gettext domains to push 
+        (see ``get_domains``), default to the domain of the kind ('django' or 
+        'messages'). The catalogs of the other domains are sent with a 
+        'domain' parameter, all of them are sent concurrently. Since a service 
+        ignoring this parameter would take them as the kind catalog, the other 
+        domains are only sent if the project details list them in their 
+        'domains' item, the other ones are skipped with a warning.
+        
+        After the push, 'push_results' attribute is a dict of the result 
+        ('pushed' or 'unchanged') for each domain and 'push_stats' attribute 
+        contains the used mode and the body sizes before and after compression 
+        of the pushed catalogs
+        
+        The hash of the last pushed catalog is keeped in the state, the push is 
+        skipped if the catalog has not changed since, unless @force arg is True. 
+        'pushed' attribute tells if a catalog has been sent.
         """
+        self.pushed = False
+        self.push_results = {}
+        self.push_stats = None
         self.logger.debug("Sending current POT file")
         # Get project datas
         self.get_project(slug)
         
-        # Resolve and validate the POT file path
-        pot_filepath = os.path.join(locale_path, "LC_MESSAGES/messages.pot")
-        if kind == 'django':
-            pot_filepath = os.path.join(locale_path, django_default_locale, "LC_MESSAGES/django.po")
-        if not os.path.exists(pot_filepath):
-            raise PotDoesNotExistException("Catalog file does not exists: '{0}'".format(pot_filepath))
+        domains = domains or [kind]
+        unsupported = [item for item in domains if item != kind and item not in (self.project_domains or [])]
+        if unsupported:
+            self.logger.warning("The service does not support the domains: %s, they are not pushed", ', '.join(unsupported))
+            domains = [item for item in domains if item not in unsupported]
+        if not domains:
+            return
+        
+        # Resolve and validate the POT file paths
+        catalogs = [(domain, self.get_pot_filepath(locale_path, kind, django_default_locale, domain=domain)) for domain in domains]
+        for domain, pot_filepath in catalogs:
+            if not os.path.exists(pot_filepath):
+                raise PotDoesNotExistException("Catalog file does not exists: '{0}'".format(pot_filepath))
+        
+        def push_domain(item):
+            # Errors are returned so every domain is pushed before raising one
+            try:
+                return item[0], self.push_catalog(slug, kind, item[0], item[1], mode=mode, force=force), None
+            except Exception as e:
+                return item[0], None, e
+        
+        if len(catalogs) > 1:
+            pool = ThreadPool(min(len(catalogs), self.default_pool_size))
+            try:
+                results = pool.map(push_domain, catalogs)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [push_domain(catalogs[0])]
+        
+        errors = []
+        for domain, stats, error in results:
+            if error is not None:
+                errors.append(error)
+                continue
+            self.push_results[domain] = 'pushed' if stats else 'unchanged'
+            if stats:
+                self.pushed = True
+                self.push_stats = self.push_stats or {'mode': stats['mode'], 'raw_bytes': 0, 'sent_bytes': 0}
+                self.push_stats['raw_bytes'] += stats['raw_bytes']
+                self.push_stats['sent_bytes'] += stats['sent_bytes']
+        if errors:
+            raise errors[0]
+    
+    def push_catalog(self, slug, kind, domain, pot_filepath, mode=None, force=False):
+        """
+        Send a domain catalog, unless it has not changed since its last push
+        
+        Return a dict of the used mode and the body sizes, or None if the 
+        catalog has not been sent
+        """
+        # Skip the push if the catalog has not changed since the last one
+        hash_key = self.get_push_hash_key(slug, kind, domain)
+        with self.metrics.phase('hash'):
+            pot_hash = catalog_hash(pot_filepath)
+        if not force and self.state is not None and self.state.get('push_hashes', hash_key) == pot_hash:
+            self.logger.info("Catalog '%s' has not changed since the last push, nothing to do", domain)
+            return None
         
-        # Open the file path
-        with open(pot_filepath, 'r') as infile:
-            pot_file_content = infile.read()
+        mode = mode or self.default_push_mode
+        if mode not in self.push_modes:
+            raise ValueError("Invalid push mode: {0}".format(mode))
+        
+        # The kind domain is sent without parameter, like before the domains 
+        # support
+        params = {'domain': domain} if domain != kind else None
         
         # Send the current POT file content
-        response = self.project_detail_url.patch(data=json.dumps({'pot': pot_file_content}), headers=self.client_headers)
+        response, raw_size, sent_size = self.send_pot(pot_filepath, mode, params=params)
+        
         if response.status_code != 200:
             if self.debug_requests:
                 print response.json()
             response.raise_for_status()
+        
+        if self.state is not None:
+            self.state.set('push_hashes', hash_key, pot_hash)
+        stats = {'domain': domain, 'mode': mode, 'raw_bytes': raw_size, 'sent_bytes': sent_size}
+        self.metrics.count('raw_bytes', raw_size)
+        self.metrics.count('sent_bytes', sent_size)
+        self.logger.info("Sent catalog '%(domain)s', %(sent_bytes)s bytes with '%(mode)s' mode (%(raw_bytes)s bytes before compression)", stats)
+        return stats
+    
+    def get_pot_filepath(self, locale_path, kind, django_default_locale=None, domain=None):
+        """
+        Return the path of the catalog file to push for the given domain, 
+        default to the domain of the kind
+        """
+        return get_catalog_filepath(locale_path, kind, django_default_locale=django_default_locale, domain=domain)
+    
+    def get_domains(self, locale_path, kind, django_default_locale=None):
+        """
+        Return the domains of the catalogs found beside the kind catalog, the 
+        kind domain first
+        """
+        dirpath = os.path.dirname(self.get_pot_filepath(locale_path, kind, django_default_locale))
+        extension = '.po' if kind == 'django' else '.pot'
+        domains = [os.path.splitext(item)[0] for item in sorted(os.listdir(dirpath)) if item.endswith(extension)] if os.path.isdir(dirpath) else []
+        return [kind]+[item for item in domains if item != kind]
+    
+    def get_push_hash_key(self, slug, kind, domain=None):
+        if domain and domain != kind:
+            return '{0}|{1}|{2}|{3}'.format(self.root_url, slug, kind, domain)
+        return '{0}|{1}|{2}'.format(self.root_url, slug, kind)
+    
+    def remember_catalog(self, slug, kind, pot_filepath, domain=None):
+        """
+        Keep the catalog hash as the last pushed one, so the catalog is not 
+        pushed until it changes
+        """
+        if self.state is not None and os.path.exists(pot_filepath):
+            self.state.set('push_hashes', self.get_push_hash_key(slug, kind, domain), catalog_hash(pot_filepath))
+    
+    def send_pot(self, pot_filepath, mode, params=None):
+        """
+        Send the POT file content with the given push mode, @params are the 
+        optional query parameters
+        
+        Return the response, the body size and the sent body size
+        """
+        if mode == 'multipart':
+            with open(pot_filepath, 'rb') as infile, self.metrics.phase('upload'):
+                response = self.project_detail_url.patch(files={'pot': (os.path.basename(pot_filepath), infile)}, params=params, headers={'client_agent': self.client_headers['client_agent']})
+            size = os.path.getsize(pot_filepath)
+            return response, size, size
+        
+        # Build the body in a temporary file so it can be streamed with a 
+        # known length
+        headers = dict(self.client_headers)
+        if mode == 'gzip':
+            headers['content-encoding'] = 'gzip'
+        with open(pot_filepath, 'rb') as infile, self.metrics.phase('encode'):
+            body = tempfile.TemporaryFile()
+            raw_size = write_json_pot(infile, body, compress=(mode == 'gzip'), chunk_size=self.chunk_size)
+        sent_size = body.tell()
+        body.seek(0)
+        try:
+            with self.metrics.phase('upload'):
+                response = self.project_detail_url.patch(data=body, params=params, headers=headers)
+        finally:
+            body.close()
+        return response, raw_size, sent_size
  
 
 # Testing
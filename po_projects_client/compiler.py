@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Compile the installed PO catalogs to MO files
+"""
+import glob, logging, os
+
+from po_projects_client.catalog import read_po, compile_messages, write_atomic
+from po_projects_client.pool import map_processes
+
+def compile_catalog(po_filepath):
+    """
+    Compile a PO file to the MO file beside it
+    
+    Return 'skipped' if the MO file is newer than the PO file, 'unchanged' if
+    the compiled content is identical to the existing MO file (which is not
+    rewritten) else 'compiled'
+    """
+    mo_filepath = os.path.splitext(po_filepath)[0]+'.mo'
+    if os.path.exists(mo_filepath) and os.path.getmtime(mo_filepath) >= os.path.getmtime(po_filepath):
+        return 'skipped'
+    
+    with open(po_filepath, 'rb') as fp:
+        content = compile_messages(read_po(fp))
+    
+    if os.path.exists(mo_filepath):
+        with open(mo_filepath, 'rb') as fp:
+            if fp.read() == content:
+                return 'unchanged'
+    
+    write_atomic(mo_filepath, content)
+    return 'compiled'
+
+def compile_catalogs(locale_path, domain=None, jobs=None):
+    """
+    Compile every '<locale>/LC_MESSAGES/<domain>.po' catalog from the locale
+    directory on a process pool of @jobs processes (default to the CPU count),
+    the catalogs of every domain are compiled if @domain is None
+    
+    Return a dict of counters for 'compiled', 'unchanged', 'skipped' and
+    'failed' catalogs
+    """
+    logger = logging.getLogger('po_projects_client')
+    po_filepaths = sorted(glob.glob(os.path.join(locale_path, '*', 'LC_MESSAGES', '{0}.po'.format(domain or '*'))))
+    
+    results = map_processes(compile_catalog, po_filepaths, jobs=jobs)
+    
+    summary = {'compiled': 0, 'unchanged': 0, 'skipped': 0, 'failed': 0}
+    for po_filepath, status, error in results:
+        summary[status or 'failed'] += 1
+        if error:
+            logger.error("Unable to compile %s: %s", po_filepath, error)
+        else:
+            logger.debug("Catalog %s: %s", po_filepath, status)
+    
+    logger.info("%(compiled)s compiled, %(unchanged)s unchanged, %(skipped)s up to date and %(failed)s failed catalogs", summary)
+    return summary
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Tarball compressions accepted by the client and their streaming decompression
+
+The 'xz' compression needs the 'lzma' module, from the optional
+'backports.lzma' package on Python 2, it is not accepted when it is not
+available.
+"""
+import bz2, zlib
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+# Compression names, in the default order of preference
+COMPRESSIONS = ('gz', 'xz', 'bz2', 'none')
+
+# Media types of the tarballs for each compression
+MEDIA_TYPES = {
+    'gz': 'application/gzip',
+    'bz2': 'application/x-bzip2',
+    'xz': 'application/x-xz',
+    'none': 'application/x-tar',
+}
+
+# Magic bytes starting the compressed datas
+MAGICS = (
+    ('gz', '\x1f\x8b'),
+    ('bz2', 'BZh'),
+    ('xz', '\xfd7zXZ\x00'),
+)
+
+class UnsupportedCompressionException(Exception):
+    pass
+
+def available_compressions():
+    """
+    Return the names of the compressions the client can decompress, in the
+    default order of preference
+    """
+    return [item for item in COMPRESSIONS if item != 'xz' or lzma is not None]
+
+def accept_header(preferred=None):
+    """
+    Return the 'Accept' header value for the available compressions, the
+    @preferred one first then the other ones with a decreasing quality
+    """
+    names = available_compressions()
+    if preferred in names:
+        names.remove(preferred)
+        names.insert(0, preferred)
+    items = [MEDIA_TYPES[names[0]]]
+    for index, name in enumerate(names[1:], start=1):
+        items.append('{0};q={1:.1f}'.format(MEDIA_TYPES[name], 1-index*0.1))
+    return ', '.join(items)
+
+def detect_compression(datas):
+    """
+    Return the compression name of the given first bytes of a tarball
+    """
+    for name, magic in MAGICS:
+        if datas.startswith(magic):
+            return name
+    return 'none'
+
+def get_decompressor(name):
+    """
+    Return an incremental decompressor object for the compression name, or
+    None for uncompressed datas
+    """
+    if name == 'gz':
+        # Accept the gzip header and trailer
+        return zlib.decompressobj(16+zlib.MAX_WBITS)
+    if name == 'bz2':
+        return bz2.BZ2Decompressor()
+    if name == 'xz':
+        if lzma is None:
+            raise UnsupportedCompressionException("Unable to decompress a 'xz' tarball, the 'backports.lzma' package is not installed")
+        return lzma.LZMADecompressor()
+    return None
+
+
+class DecompressingReader(object):
+    """
+    Read-only file object decompressing a stream block by block
+    
+    The compression is detected from the first block, uncompressed datas are
+    passed through. It only supports sequential reads, like the tarfile
+    stream mode does.
+    """
+    def __init__(self, fileobj, chunk_size=64*1024):
+        self.fileobj = fileobj
+        self.chunk_size = chunk_size
+        self._pending = fileobj.read(chunk_size)
+        self.compression = detect_compression(self._pending)
+        self._decompressor = get_decompressor(self.compression)
+        self._buffer = ''
+        self._eof = False
+    
+    def _fill(self):
+        datas = self._pending or self.fileobj.read(self.chunk_size)
+        self._pending = ''
+        if not datas:
+            self._eof = True
+            if hasattr(self._decompressor, 'flush'):
+                self._buffer += self._decompressor.flush()
+        elif self._decompressor is None:
+            self._buffer += datas
+        else:
+            self._buffer += self._decompressor.decompress(datas)
+    
+    def read(self, size=-1):
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            self._fill()
+        if size < 0 or size >= len(self._buffer):
+            datas, self._buffer = self._buffer, ''
+        else:
+            datas, self._buffer = self._buffer[:size], self._buffer[size:]
+        return datas
+    
+    def close(self):
+        pass
@@ -3,11 +3,19 @@ import os, ConfigParser
 class POProjectConfig(object):
     """
     PO-Project config object know how to get, set and save data from/to the config file
+    
+    Additionally to the main section, the config file can contains named 
+    project sections like '[PO_Project:myapp]', their values are inherited from 
+    the main section.
     """
     main_section_name = 'PO_Project'
-    options = ['user', 'password', 'host', 'locale_path', 'kind', 'django_default_locale', 'project_id', 'project_slug']
-    integers = ['project_id']
-    booleans = []
+    project_section_prefix = 'PO_Project:'
+    options = ['user', 'password', 'host', 'locale_path', 'kind', 'django_default_locale', 'project_id', 'project_slug', 'chunk_size', 'tarball_etag', 'tarball_last_modified', 'tarball_hash', 'install_mode', 'prune', 'keep_versions', 'pool_size', 'timeout', 'metadata_ttl', 'push_mode', 'retries', 'retry_backoff', 'locales', 'domains', 'cache_dir', 'cache_size', 'source_dirs', 'compression', 'lock_timeout']
+    integers = ['project_id', 'chunk_size', 'keep_versions', 'pool_size', 'timeout', 'metadata_ttl', 'retries', 'retry_backoff', 'cache_size', 'lock_timeout']
+    booleans = ['prune']
+    # Options only read from the config file, their command line values only 
+    # apply to the current run
+    readonly = ['prune', 'locales', 'domains']
     
     def __init__(self):
         self._datas = None
@@ -25,42 +33,80 @@ class POProjectConfig(object):
         if not self.parser.has_section(self.main_section_name):
             self.parser.add_section(self.main_section_name)
     
-    def set_datas(self, datas):
+    def get_projects(self):
+        """
+        Get the names of the project sections
+        """
+        prefix = self.project_section_prefix
+        return [item[len(prefix):] for item in self.parser.sections() if item.startswith(prefix) and item[len(prefix):]]
+    
+    def _get_section_name(self, name=None):
+        if name is None:
+            return self.main_section_name
+        section = self.project_section_prefix+name
+        if not self.parser.has_section(section):
+            self.parser.add_section(section)
+        return section
+    
+    def _format_value(self, key, value):
+        # Format number values to string
+        if key in self.integers:
+            value = str(value)
+        # Format boolean values to string
+        if key in self.booleans:
+            value = str(value).lower()
+        return value
+    
+    def set_datas(self, datas, name=None):
         """
         Update datas from a dict
+        
+        If a project name is given, the values are saved in its section unless 
+        they are identical to the main section ones
         """
-        if self._datas is None:
-            self._datas = {}
-        self._datas.update(datas)
+        if name is None:
+            if self._datas is None:
+                self._datas = {}
+            self._datas.update(datas)
+        section = self._get_section_name(name)
         for k,v in datas.items():
             # Don't try to save None values
             if v is None:
                 continue
-            # Format number values to string
-            if k in self.integers:
-                v = str(v)
-            # Format boolean values to string
-            if k in self.booleans:
-                v = str(v).lower()
-            self.parser.set(self.main_section_name, k, v)
-        return self._datas
+            v = self._format_value(k, v)
+            # Don't duplicate the values inherited from the main section
+            if name is not None and not self.parser.has_option(section, k) \
+                    and self.parser.has_option(self.main_section_name, k) \
+                    and self.parser.get(self.main_section_name, k) == v:
+                continue
+            self.parser.set(section, k, v)
+        return self.get_datas(name) if name is not None else self._datas
     
-    def get_datas(self):
+    def get_datas(self, name=None):
         """
         Get all valid datas from the readed config file
+        
+        If a project name is given, the values of its section are merged over 
+        the main section ones
         """
-        if self._datas is None:
-            self._datas = {}
-        q = [item for item in self.parser.options(self.main_section_name) if item in self.options]
+        if name is None:
+            if self._datas is None:
+                self._datas = {}
+            datas = self._datas
+        else:
+            datas = self.get_datas().copy()
+        
+        section = self._get_section_name(name)
+        q = [item for item in self.parser.options(section) if item in self.options]
         for item in q:
-            val = self.parser.get(self.main_section_name, item)
+            val = self.parser.get(section, item)
             # Re apply format for non string value
             if item in self.integers:
                 val = int(val)
             if item in self.booleans:
                 val = (val == 'true')
-            self._datas[item] = val
-        return self._datas
+            datas[item] = val
+        return datas
     
     def save(self):
         """
@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+"""
+Extract the translatable messages from the source files to the catalog that
+``push`` sends
+
+Python files are read with ``tokenize``, templates with regular expressions
+for the Django or Jinja2 translation tags. Extracted messages are cached by
+file so only new or changed files are read again.
+"""
+import ast, datetime, hashlib, logging, os, re, tokenize
+from StringIO import StringIO
+
+from po_projects_client.catalog import Message, read_po, format_po, write_atomic
+from po_projects_client.pool import map_processes
+from po_projects_client.state import JSONFile
+
+# Gettext functions with the argument positions of their context, msgid and
+# plural
+KEYWORDS = {
+    '_': (None, 0, None),
+    'gettext': (None, 0, None),
+    'ugettext': (None, 0, None),
+    'gettext_lazy': (None, 0, None),
+    'ugettext_lazy': (None, 0, None),
+    'gettext_noop': (None, 0, None),
+    'ugettext_noop': (None, 0, None),
+    'ngettext': (None, 0, 1),
+    'ungettext': (None, 0, 1),
+    'ngettext_lazy': (None, 0, 1),
+    'ungettext_lazy': (None, 0, 1),
+    'pgettext': (0, 1, None),
+    'pgettext_lazy': (0, 1, None),
+    'npgettext': (0, 1, 2),
+    'npgettext_lazy': (0, 1, 2),
+}
+
+# Extensions of the template files
+TEMPLATE_EXTENSIONS = ('.html', '.txt')
+
+STRING = r'''(?:"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')'''
+TRANS_FUNCTION = re.compile(r'\b_\(\s*(?P<msgid>{0})\s*\)'.format(STRING))
+DJANGO_TRANS = re.compile(r'{{%-?\s*(?:trans|translate)\s+(?P<msgid>{0})(?P<options>.*?)-?%}}'.format(STRING))
+DJANGO_BLOCKTRANS = re.compile(r'{%-?\s*(?:blocktrans|blocktranslate)\b(?P<options>.*?)-?%}(?P<content>.*?){%-?\s*(?:endblocktrans|endblocktranslate)\s*-?%}', re.S)
+DJANGO_PLURAL = re.compile(r'{%-?\s*plural\s*-?%}')
+JINJA_TRANS = re.compile(r'{%-?\s*trans\b(?P<options>[^%]*?)-?%}(?P<content>.*?){%-?\s*endtrans\s*-?%}', re.S)
+JINJA_PLURAL = re.compile(r'{%-?\s*pluralize\b[^%]*-?%}')
+JINJA_FUNCTION = re.compile(r'\b(?P<keyword>gettext|ngettext|pgettext|npgettext)\(\s*(?P<args>{0}(?:\s*,\s*{0})*)'.format(STRING))
+CONTEXT_OPTION = re.compile(r'\bcontext\s+(?P<context>{0})'.format(STRING))
+TEMPLATE_VARIABLE = re.compile(r'{{-?\s*(\w+)[^}]*-?}}')
+
+def _literal(string):
+    value = ast.literal_eval(string)
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return value
+
+def extract_python(content):
+    """
+    Yield (line number, context, msgid, plural) for the gettext calls of a
+    Python source
+    """
+    # Arguments of the opened calls, None for the non keyword calls
+    calls, keyword, lineno = [], None, None
+    try:
+        for toktype, string, start, end, line in tokenize.generate_tokens(StringIO(content).readline):
+            if toktype == tokenize.NAME and string in KEYWORDS:
+                keyword, lineno = string, start[0]
+                continue
+            if toktype == tokenize.OP and string == '(':
+                # Arguments are lists of literal string parts, None for the
+                # other arguments
+                calls.append((keyword, lineno, [[]]))
+            elif calls and toktype == tokenize.OP and string == ')':
+                name, call_lineno, args = calls.pop()
+                if name is not None:
+                    message = _build_call_message(name, args)
+                    if message:
+                        yield (call_lineno,)+message
+            elif calls and toktype == tokenize.OP and string == ',' and calls[-1][2] is not None:
+                calls[-1][2].append([])
+            elif calls and toktype == tokenize.STRING:
+                if calls[-1][2][-1] is not None:
+                    calls[-1][2][-1].append(_literal(string))
+            elif calls and toktype not in (tokenize.NL, tokenize.COMMENT, tokenize.NEWLINE):
+                calls[-1][2][-1] = None
+            keyword = None
+    except (tokenize.TokenError, IndentationError):
+        # Incomplete source, keep what has been found
+        return
+
+def _build_call_message(name, args):
+    context_index, msgid_index, plural_index = KEYWORDS[name]
+    def get(index):
+        if index is None:
+            return None
+        if index >= len(args) or not args[index]:
+            raise ValueError
+        return ''.join(args[index])
+    try:
+        msgid = get(msgid_index)
+        return get(context_index), msgid, get(plural_index)
+    except ValueError:
+        # Not literal strings
+        return None
+
+def _lineno(content, position):
+    return content.count('\n', 0, position)+1
+
+def _block_string(content, trimmed=False):
+    # Variables are replaced with named placeholders, like 'makemessages' does
+    content = TEMPLATE_VARIABLE.sub(r'%(\1)s', content)
+    if trimmed:
+        content = ' '.join([item.strip() for item in content.splitlines() if item.strip()])
+    return content
+
+def extract_django_template(content):
+    """
+    Yield (line number, context, msgid, plural) for the translation tags and
+    the '_()' strings of a Django template
+    """
+    for match in DJANGO_TRANS.finditer(content):
+        context = CONTEXT_OPTION.search(match.group('options'))
+        yield _lineno(content, match.start()), _literal(context.group('context')) if context else None, _literal(match.group('msgid')), None
+    for match in DJANGO_BLOCKTRANS.finditer(content):
+        options = match.group('options')
+        context = CONTEXT_OPTION.search(options)
+        parts = DJANGO_PLURAL.split(match.group('content'), 1)
+        strings = [_block_string(item, trimmed=re.search(r'\btrimmed\b', options) is not None) for item in parts]
+        yield _lineno(content, match.start()), _literal(context.group('context')) if context else None, strings[0], strings[1] if len(strings) > 1 else None
+    for match in TRANS_FUNCTION.finditer(content):
+        yield _lineno(content, match.start()), None, _literal(match.group('msgid')), None
+
+def extract_jinja_template(content):
+    """
+    Yield (line number, context, msgid, plural) for the translation tags and
+    the gettext calls of a Jinja2 template
+    """
+    for match in JINJA_TRANS.finditer(content):
+        parts = JINJA_PLURAL.split(match.group('content'), 1)
+        strings = [_block_string(item, trimmed=re.search(r'\btrimmed\b', match.group('options')) is not None) for item in parts]
+        yield _lineno(content, match.start()), None, strings[0], strings[1] if len(strings) > 1 else None
+    for match in TRANS_FUNCTION.finditer(content):
+        yield _lineno(content, match.start()), None, _literal(match.group('msgid')), None
+    for match in JINJA_FUNCTION.finditer(content):
+        args = [_literal(item) for item in re.findall(STRING, match.group('args'))]
+        message = _build_call_message(match.group('keyword'), [[item] for item in args])
+        if message:
+            yield (_lineno(content, match.start()),)+message
+
+def get_extract_method(filepath, kind):
+    """
+    Return the name of the extract method for a source file, or None if it
+    is not a source file
+    """
+    extension = os.path.splitext(filepath)[1]
+    if extension == '.py':
+        return 'python'
+    if extension in TEMPLATE_EXTENSIONS:
+        return 'django' if kind == 'django' else 'jinja'
+    return None
+
+EXTRACT_METHODS = {
+    'python': extract_python,
+    'django': extract_django_template,
+    'jinja': extract_jinja_template,
+}
+
+def _extract_file(item):
+    """
+    Extract the messages of a source file from a (file path, extract method,
+    known content hash) item
+    
+    Return the content hash and the list of the messages, None if the content
+    hash is the known one
+    """
+    filepath, method, known_hash = item
+    with open(filepath, 'rb') as fp:
+        content = fp.read()
+    content_hash = hashlib.sha1(content).hexdigest()
+    if content_hash == known_hash:
+        return content_hash, None
+    return content_hash, [list(message) for message in EXTRACT_METHODS[method](content) if message[2]]
+
+
+class ExtractionCache(JSONFile):
+    """
+    A JSON file keeping the messages extracted from each source file
+    
+    A file is only read again when its mtime or size has changed, and only
+    extracted again if its content hash has changed. It can be shared between
+    threads, changes are only written on ``save``.
+    """
+    def get(self, filepath):
+        with self._lock:
+            return self._datas.get(os.path.abspath(filepath))
+    
+    def set(self, filepath, entry):
+        with self._lock:
+            self._datas[os.path.abspath(filepath)] = entry
+            self._changed = True
+
+
+def find_sources(source_dirs, kind, excludes=None):
+    """
+    Return the sorted list of (file path, extract method) of the source files
+    from the given directories, hidden and @excludes directories are skipped
+    """
+    excludes = [os.path.abspath(item) for item in excludes or []]
+    sources = []
+    for source_dir in source_dirs:
+        for dirpath, dirnames, filenames in os.walk(source_dir):
+            dirnames[:] = [item for item in dirnames if not item.startswith('.') and os.path.abspath(os.path.join(dirpath, item)) not in excludes]
+            for filename in filenames:
+                method = get_extract_method(filename, kind)
+                if method:
+                    sources.append((os.path.join(dirpath, filename), method))
+    return sorted(sources)
+
+def extract_messages(source_dirs, kind, cache=None, excludes=None, jobs=None):
+    """
+    Extract the messages of the source files on a process pool of @jobs
+    processes (default to the CPU count), only for the files changed since
+    their cached extraction
+    
+    Return a list of (context, msgid, plural) in their first source order, a
+    dict of their (path, line number) locations and a dict of counters for
+    'files', 'extracted', 'cached' and 'failed' files
+    """
+    logger = logging.getLogger('po_projects_client')
+    summary = {'files': 0, 'extracted': 0, 'cached': 0, 'failed': 0}
+    
+    entries, todo = {}, []
+    for filepath, method in find_sources(source_dirs, kind, excludes=excludes):
+        summary['files'] += 1
+        stat = os.stat(filepath)
+        entry = cache.get(filepath) if cache is not None else None
+        if entry and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+            entries[filepath] = entry
+        else:
+            todo.append((filepath, method, entry['hash'] if entry else None))
+    
+    for (filepath, method, known_hash), result, error in map_processes(_extract_file, todo, jobs=jobs):
+        if error:
+            summary['failed'] += 1
+            logger.error("Unable to extract messages from %s: %s", filepath, error)
+            continue
+        content_hash, messages = result
+        stat = os.stat(filepath)
+        if messages is None:
+            # Touched but not changed
+            messages = cache.get(filepath)['messages']
+        else:
+            summary['extracted'] += 1
+        entries[filepath] = {'mtime': stat.st_mtime, 'size': stat.st_size, 'hash': content_hash, 'messages': messages}
+        if cache is not None:
+            cache.set(filepath, entries[filepath])
+    summary['cached'] = summary['files']-summary['extracted']-summary['failed']
+    
+    # Merge the messages found in several places
+    keys, locations = [], {}
+    for filepath in sorted(entries):
+        for lineno, context, msgid, plural in entries[filepath]['messages']:
+            context = context.encode('utf-8') if isinstance(context, unicode) else context
+            msgid = msgid.encode('utf-8') if isinstance(msgid, unicode) else msgid
+            plural = plural.encode('utf-8') if isinstance(plural, unicode) else plural
+            key = (context, msgid)
+            if key not in locations:
+                keys.append((context, msgid, plural))
+                locations[key] = []
+            locations[key].append((os.path.normpath(filepath), lineno))
+    
+    return keys, locations, summary
+
+def default_header():
+    return '\n'.join([
+        'Project-Id-Version: PACKAGE VERSION',
+        'Report-Msgid-Bugs-To: ',
+        'POT-Creation-Date: {0}'.format(datetime.datetime.now().strftime('%Y-%m-%d %H:%M+0000')),
+        'MIME-Version: 1.0',
+        'Content-Type: text/plain; charset=UTF-8',
+        'Content-Transfer-Encoding: 8bit',
+    ])+'\n'
+
+def extract_catalog(source_dirs, catalog_filepath, kind, cache=None, excludes=None, jobs=None):
+    """
+    Extract the messages of the source files to the catalog file
+    
+    The translations and flags of an existing catalog are keeped for the
+    messages still found, the other messages are removed. The catalog file
+    is only written if its content has changed.
+    
+    Return the ``extract_messages`` summary with the number of 'messages' and
+    a 'written' boolean
+    """
+    keys, locations, summary = extract_messages(source_dirs, kind, cache=cache, excludes=excludes, jobs=jobs)
+    
+    previous, existing = '', {}
+    if os.path.exists(catalog_filepath):
+        with open(catalog_filepath, 'rb') as fp:
+            previous = fp.read()
+        existing = dict([((item.context, item.id), item) for item in read_po(previous.splitlines(True)) if not item.obsolete])
+    
+    header = existing.get((None, ''))
+    messages = [header or Message(None, '', None, (default_header(),), frozenset(['fuzzy']) if kind == 'django' else frozenset([]), False)]
+    for context, msgid, plural in keys:
+        message = existing.get((context, msgid))
+        if message is not None and (message.plural is None) == (plural is None):
+            messages.append(message._replace(plural=plural))
+        else:
+            messages.append(Message(context, msgid, plural, ('', '') if plural is not None else ('',), frozenset([]), False))
+    
+    content = format_po(messages, locations=locations)
+    summary['messages'] = len(keys)
+    summary['written'] = content != previous
+    if summary['written']:
+        catalog_dir = os.path.dirname(os.path.abspath(catalog_filepath))
+        if not os.path.isdir(catalog_dir):
+            os.makedirs(catalog_dir)
+        write_atomic(catalog_filepath, content)
+    return summary
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Local index of the installed catalogs, to report their state without parsing
+them again
+"""
+import glob, hashlib, os
+
+from po_projects_client.catalog import read_po
+from po_projects_client.state import JSONFile
+
+# Translation states of the indexed messages
+TRANSLATED, FUZZY, UNTRANSLATED = 't', 'f', 'u'
+
+def index_catalog(filepath):
+    """
+    Return the index entry of a PO file: its stat signature, content hash and
+    the translation state of each message by msgid hash
+    """
+    stat = os.stat(filepath)
+    with open(filepath, 'rb') as fp:
+        content = fp.read()
+    
+    messages = {}
+    for message in read_po(content.splitlines(True)):
+        if not message.id or message.obsolete:
+            continue
+        key = hashlib.sha1('{0}\x04{1}'.format(message.context or '', message.id)).hexdigest()[:12]
+        if not all(message.strings):
+            messages[key] = UNTRANSLATED
+        elif 'fuzzy' in message.flags:
+            messages[key] = FUZZY
+        else:
+            messages[key] = TRANSLATED
+    
+    return {
+        'mtime': stat.st_mtime,
+        'size': stat.st_size,
+        'hash': hashlib.sha1(content).hexdigest(),
+        'messages': messages,
+    }
+
+class CatalogIndex(JSONFile):
+    """
+    A JSON file indexing the PO files of locale directories
+    
+    A file is only parsed again when its mtime or size has changed. The index
+    also keeps the hashes of the files installed by the last pull, to tell
+    the locally modified files.
+    
+    It can be shared between threads, changes are only written on ``save``.
+    """
+    def _get_section(self, locale_path):
+        return self._datas.setdefault(os.path.abspath(locale_path), {'files': {}, 'installed': {}})
+    
+    def update(self, locale_path):
+        """
+        Index the new or changed PO files of the locale directory and forget
+        the removed ones
+        
+        Return the number of parsed files
+        """
+        with self._lock:
+            files = self._get_section(locale_path)['files']
+            seen, parsed = set([]), 0
+            for filepath in glob.glob(os.path.join(locale_path, '*', 'LC_MESSAGES', '*.po')):
+                path = os.path.relpath(filepath, locale_path)
+                seen.add(path)
+                stat = os.stat(filepath)
+                entry = files.get(path)
+                if entry and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+                    continue
+                files[path] = index_catalog(filepath)
+                parsed += 1
+            removed = set(files.keys())-seen
+            for path in removed:
+                del files[path]
+            self._changed = self._changed or parsed > 0 or len(removed) > 0
+            return parsed
+    
+    def set_installed(self, locale_path, hashes, locales=None):
+        """
+        Keep the content hashes of the files installed by a pull, @hashes is a
+        dict of hashes by file path relative to the locale directory
+        
+        The previous hashes of the pulled @locales (all of them if None) are
+        replaced, so the files removed by the pull are not missing.
+        """
+        with self._lock:
+            installed = self._get_section(locale_path)['installed']
+            for path in list(installed):
+                if locales is None or path.split(os.sep)[0] in locales:
+                    del installed[path]
+            installed.update(hashes)
+            self._changed = True
+    
+    def get_locales(self, locale_path):
+        """
+        Return a dict of counters for each locale: 'messages', 'translated',
+        'fuzzy', 'modified' (files changed since the last pull) and 'missing'
+        (files removed since the last pull)
+        """
+        with self._lock:
+            section = self._get_section(locale_path)
+            locales = {}
+            def get_counters(path):
+                return locales.setdefault(path.split(os.sep)[0], {'messages': 0, 'translated': 0, 'fuzzy': 0, 'modified': 0, 'missing': 0})
+            
+            for path, entry in section['files'].items():
+                counters = get_counters(path)
+                states = entry['messages'].values()
+                counters['messages'] += len(states)
+                counters['translated'] += states.count(TRANSLATED)
+                counters['fuzzy'] += states.count(FUZZY)
+                if path in section['installed'] and section['installed'][path] != entry['hash']:
+                    counters['modified'] += 1
+            for path in section['installed']:
+                if path.endswith('.po') and path not in section['files']:
+                    get_counters(path)['missing'] += 1
+            return locales
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+Installers to put an extracted locale directory in place
+"""
+import ctypes, ctypes.util, datetime, hashlib, logging, os, shutil
+
+# Compiled catalogs are never in the tarball, they are built locally
+PROTECTED_EXTENSIONS = ('.mo',)
+
+# Flag for renameat2() to atomically exchange two paths (Linux >= 3.15)
+RENAME_EXCHANGE = 2
+AT_FDCWD = -100
+
+def exchange_paths(first, second):
+    """
+    Atomically exchange two paths on the same filesystem
+    
+    Return False if the platform does not support it, so the caller can
+    fallback to successive renames
+    """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        renameat2 = libc.renameat2
+    except (OSError, AttributeError, TypeError):
+        return False
+    if renameat2(AT_FDCWD, first, AT_FDCWD, second, RENAME_EXCHANGE) != 0:
+        return False
+    return True
+
+def staging_dir(destination):
+    """
+    Return the parent directory to use for staging, it is the destination
+    parent directory so the final moves are renames on the same filesystem
+    """
+    parent = os.path.dirname(os.path.abspath(destination))
+    if not os.path.isdir(parent):
+        os.makedirs(parent)
+    return parent
+
+def file_hash(filepath, chunk_size=64*1024):
+    """
+    Return the SHA1 hex digest of a file content
+    """
+    digest = hashlib.sha1()
+    with open(filepath, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(chunk_size), ''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def walk_files(root):
+    """
+    Return the set of file paths (relative to root) inside the root directory
+    """
+    paths = set([])
+    for dirpath, dirnames, filenames in os.walk(root):
+        for filename in filenames:
+            paths.add(os.path.relpath(os.path.join(dirpath, filename), root))
+    return paths
+
+def copy_file(source, destination):
+    """
+    Copy a file to its destination through a temporary file renamed in place,
+    so readers never see a half-written file
+    """
+    dirpath = os.path.dirname(destination)
+    if not os.path.isdir(dirpath):
+        os.makedirs(dirpath)
+    tmp_destination = os.path.join(dirpath, '.{0}.tmp'.format(os.path.basename(destination)))
+    shutil.copyfile(source, tmp_destination)
+    os.rename(tmp_destination, destination)
+
+def link_tree(source, destination):
+    """
+    Rebuild a directory tree with hard links to its files, files are copied
+    if they can not be linked
+    """
+    for dirpath, dirnames, filenames in os.walk(source):
+        target_dir = os.path.join(destination, os.path.relpath(dirpath, source))
+        if not os.path.isdir(target_dir):
+            os.makedirs(target_dir)
+        for filename in filenames:
+            try:
+                os.link(os.path.join(dirpath, filename), os.path.join(target_dir, filename))
+            except OSError:
+                shutil.copy2(os.path.join(dirpath, filename), os.path.join(target_dir, filename))
+
+def carry_over(installed, source, locales):
+    """
+    Add to the new source directory the items of the installed locale
+    directory that are not in the @locales list and not in the source, so
+    installing the source does not remove them
+    """
+    if not os.path.isdir(installed):
+        return
+    if not os.path.isdir(source):
+        os.makedirs(source)
+    for name in os.listdir(installed):
+        if name in locales or os.path.lexists(os.path.join(source, name)):
+            continue
+        path = os.path.join(installed, name)
+        if os.path.isdir(path):
+            link_tree(path, os.path.join(source, name))
+        else:
+            shutil.copy2(path, os.path.join(source, name))
+
+def replace_install(source, destination):
+    """
+    Remove the previous locale directory and move the new one in place
+    """
+    if os.path.islink(destination):
+        # Replace the link from a previous symlink install, its versions are 
+        # leaved as they are
+        os.unlink(destination)
+    elif os.path.exists(destination):
+        shutil.rmtree(destination)
+    shutil.move(source, destination)
+
+def incremental_install(source, destination, prune=False, locales=None):
+    """
+    Install only new or changed files from the source directory into the
+    destination directory, files are compared by content hash
+    
+    @prune arg to remove the destination files that are not in the source,
+    compiled catalogs are always keeped. If a @locales list is given, only the
+    files of these locale directories are removed
+    
+    Return a dict of counters for 'added', 'changed', 'removed' and
+    'unchanged' files
+    """
+    logger = logging.getLogger('po_projects_client')
+    destination = os.path.normpath(destination)
+    summary = {'added': 0, 'changed': 0, 'removed': 0, 'unchanged': 0}
+    
+    source_files = walk_files(source)
+    destination_files = walk_files(destination) if os.path.isdir(destination) else set([])
+    
+    for path in sorted(source_files):
+        source_path = os.path.join(source, path)
+        destination_path = os.path.join(destination, path)
+        if path not in destination_files:
+            logger.debug("Adding file: %s", path)
+            copy_file(source_path, destination_path)
+            summary['added'] += 1
+        elif os.path.getsize(source_path) != os.path.getsize(destination_path) or file_hash(source_path) != file_hash(destination_path):
+            logger.debug("Updating file: %s", path)
+            copy_file(source_path, destination_path)
+            summary['changed'] += 1
+        else:
+            summary['unchanged'] += 1
+    
+    if prune:
+        for path in sorted(destination_files - source_files):
+            if path.endswith(PROTECTED_EXTENSIONS):
+                continue
+            if locales is not None and path.split(os.sep)[0] not in locales:
+                continue
+            logger.debug("Removing stale file: %s", path)
+            os.remove(os.path.join(destination, path))
+            summary['removed'] += 1
+            # Clean the directories left empty
+            dirpath = os.path.dirname(os.path.join(destination, path))
+            while dirpath != destination and not os.listdir(dirpath):
+                os.rmdir(dirpath)
+                dirpath = os.path.dirname(dirpath)
+    
+    logger.info("%(added)s added, %(changed)s changed, %(removed)s removed and %(unchanged)s unchanged files", summary)
+    return summary
+
+def rename_install(source, destination):
+    """
+    Swap the new locale directory in place with a rename, the previous one is
+    removed after the swap
+    
+    Source must be on the same filesystem than the destination (see
+    ``staging_dir``).
+    """
+    destination = os.path.normpath(destination)
+    if not os.path.lexists(destination):
+        os.rename(source, destination)
+        return
+    if os.path.islink(destination):
+        # Replace the link from a previous symlink install, its versions are 
+        # leaved as they are
+        previous = '{0}.previous'.format(source)
+        os.rename(destination, previous)
+        os.rename(source, destination)
+        os.unlink(previous)
+        return
+    if not exchange_paths(source, destination):
+        # Fallback on two renames, the destination is only missing between 
+        # them
+        previous = '{0}.previous'.format(source)
+        os.rename(destination, previous)
+        os.rename(source, destination)
+        source = previous
+    # Source path now contains the previous locale directory
+    shutil.rmtree(source)
+
+def symlink_install(source, destination, keep_versions=2):
+    """
+    Move the new locale directory to a versioned directory then flip the
+    destination symlink to it, the oldest versions are removed to keep at most
+    ``keep_versions`` of them
+    
+    If the destination is a real directory it is moved as the first version.
+    """
+    destination = os.path.normpath(destination)
+    parent = os.path.dirname(os.path.abspath(destination))
+    versions_dir = '{0}.versions'.format(destination)
+    if not os.path.isdir(versions_dir):
+        os.makedirs(versions_dir)
+    
+    version_name = datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')
+    version_path = os.path.join(versions_dir, version_name)
+    os.rename(source, version_path)
+    
+    # The link is built aside then renamed over the destination, this is 
+    # atomic for readers
+    tmp_link = '{0}.link'.format(version_path)
+    os.symlink(os.path.relpath(version_path, parent), tmp_link)
+    if os.path.exists(destination) and not os.path.islink(destination):
+        # Named from its last change so it is sorted as the oldest version
+        legacy_name = datetime.datetime.fromtimestamp(os.path.getmtime(destination)).strftime('%Y%m%d%H%M%S%f')
+        legacy_path = os.path.join(versions_dir, legacy_name)
+        if exchange_paths(tmp_link, destination):
+            os.rename(tmp_link, legacy_path)
+        else:
+            os.rename(destination, legacy_path)
+            os.rename(tmp_link, destination)
+    else:
+        os.rename(tmp_link, destination)
+    
+    # Cleanup old versions, never the current one
+    current = os.path.basename(os.path.realpath(destination))
+    versions = sorted([item for item in os.listdir(versions_dir) if os.path.isdir(os.path.join(versions_dir, item)) and not os.path.islink(os.path.join(versions_dir, item))], reverse=True)
+    for item in versions[max(keep_versions, 1):]:
+        if item != current:
+            shutil.rmtree(os.path.join(versions_dir, item))
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Advisory lock around the install of a locale directory, shared by the
+concurrent pulls into the same destination
+
+The lock is an exclusive 'flock' on a lock file, released by the system if
+its holder dies. Where 'fcntl' is not available, the lock file is created
+exclusively and removed on release, it is considered stale if its holder
+process is not alive anymore or if it is older than the stale delay.
+
+The result of the last pull made under the lock is keeped in a file beside
+it, so a pull waiting for the lock can reuse the result of an identical pull
+instead of downloading the tarball again.
+"""
+import errno, json, logging, os, socket, tempfile, time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+class LockTimeoutException(Exception):
+    pass
+
+
+class InstallLock(object):
+    """
+    Exclusive lock for a file path, to use as a context manager
+    
+    @timeout is the maximum time in seconds to wait for the lock, None to
+    wait forever. After acquiring it, 'waited' tells if another process held
+    it.
+    """
+    # Delay in seconds between two tries to acquire a busy lock
+    poll_interval = 0.1
+    # Age in seconds of a lock file to consider it as stale, without 'fcntl'
+    default_stale_after = 600
+    
+    def __init__(self, filepath, timeout=None, stale_after=None):
+        self.logger = logging.getLogger('po_projects_client')
+        self.filepath = filepath
+        self.result_filepath = filepath+'.result'
+        self.timeout = timeout
+        self.stale_after = stale_after or self.default_stale_after
+        self.waited = False
+        self.wait_start = None
+        self._fd = None
+    
+    def _try_acquire(self):
+        if fcntl is not None:
+            fd = os.open(self.filepath, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError as e:
+                os.close(fd)
+                if e.errno in (errno.EAGAIN, errno.EACCES):
+                    return False
+                raise
+            os.ftruncate(fd, 0)
+        else:
+            try:
+                fd = os.open(self.filepath, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o644)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+                self._remove_stale()
+                return False
+        # Holder infos, for the humans and the stale check
+        os.write(fd, json.dumps({'pid': os.getpid(), 'host': socket.gethostname(), 'time': time.time()}))
+        self._fd = fd
+        return True
+    
+    def _remove_stale(self):
+        try:
+            with open(self.filepath, 'rb') as fp:
+                holder = json.load(fp)
+            age = time.time()-holder['time']
+        except (IOError, OSError, ValueError, KeyError):
+            # Being written or removed meanwhile, check it again later
+            return
+        alive = True
+        if holder.get('host') == socket.gethostname():
+            try:
+                os.kill(holder['pid'], 0)
+            except OSError as e:
+                alive = e.errno != errno.ESRCH
+        if not alive or age > self.stale_after:
+            self.logger.warning("Removing the stale lock file %s (pid %s)", self.filepath, holder.get('pid'))
+            try:
+                os.remove(self.filepath)
+            except OSError:
+                pass
+    
+    def acquire(self):
+        self.wait_start = time.time()
+        while not self._try_acquire():
+            if not self.waited:
+                self.logger.info("Waiting for another pull into the same directory")
+            self.waited = True
+            if self.timeout is not None and time.time()-self.wait_start > self.timeout:
+                raise LockTimeoutException("Unable to acquire the lock {0} after {1}s".format(self.filepath, self.timeout))
+            time.sleep(self.poll_interval)
+        return self
+    
+    def release(self):
+        if self._fd is None:
+            return
+        if fcntl is None:
+            os.remove(self.filepath)
+        os.close(self._fd)
+        self._fd = None
+    
+    def __enter__(self):
+        return self.acquire()
+    
+    def __exit__(self, *exc_info):
+        self.release()
+    
+    def read_result(self, key):
+        """
+        Return the result datas written for the given key by the holder we
+        waited for, or None if there is not any
+        """
+        if not self.waited:
+            return None
+        try:
+            with open(self.result_filepath, 'rb') as fp:
+                result = json.load(fp)
+        except (IOError, ValueError):
+            return None
+        if result.get('key') != key or result.get('time', 0) < self.wait_start:
+            return None
+        return result['datas']
+    
+    def write_result(self, key, datas):
+        """
+        Keep the result datas of the pull made under the lock for the given key
+        """
+        fd, tmp_filepath = tempfile.mkstemp(prefix='.', suffix='.tmp', dir=os.path.dirname(os.path.abspath(self.result_filepath)))
+        with os.fdopen(fd, 'wb') as fp:
+            json.dump({'key': key, 'time': time.time(), 'datas': datas}, fp)
+        os.rename(tmp_filepath, self.result_filepath)
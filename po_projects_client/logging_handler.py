@@ -5,10 +5,26 @@
 # From https://gist.github.com/758430
 #
 import ctypes
+import datetime
+import json
 import logging
 import os
+import Queue
+import threading
 
-class ColorizingStreamHandler(logging.StreamHandler):
+class BatchFlushMixin(object):
+    """
+    Stream handler mixin to defer the flush after each record while a batch 
+    of records is emitted (see ``AsyncHandler``)
+    """
+    batching = False
+    
+    def flush(self):
+        if not self.batching:
+            super(BatchFlushMixin, self).flush()
+
+
+class ColorizingStreamHandler(BatchFlushMixin, logging.StreamHandler):
     # color names to indices
     color_map = {
         'black': 0,
@@ -35,12 +51,16 @@ class ColorizingStreamHandler(logging.StreamHandler):
     def __init__(self, level_map=None, *args, **kwargs):
         if level_map is not None:
             self.level_map = level_map
+        self._is_tty = None
         logging.StreamHandler.__init__(self, *args, **kwargs)
 
     @property
     def is_tty(self):
-        isatty = getattr(self.stream, 'isatty', None)
-        return isatty and isatty()
+        # The stream does not change, no need to check it again on each record
+        if self._is_tty is None:
+            isatty = getattr(self.stream, 'isatty', None)
+            self._is_tty = bool(isatty and isatty())
+        return self._is_tty
 
     def emit(self, record):
         try:
@@ -131,9 +151,130 @@ class ColorizingStreamHandler(logging.StreamHandler):
         return message
 
 
-def init_logging(loglevel, printout=True, logfile=None):
+class BufferedFileHandler(BatchFlushMixin, logging.FileHandler):
+    """
+    File handler whose flushes can be batched
+    """
+    pass
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format records as JSON lines
+    """
+    def format(self, record):
+        datas = {
+            'time': datetime.datetime.fromtimestamp(record.created).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            datas['exception'] = record.exc_text
+        return json.dumps(datas)
+
+
+class AsyncHandler(logging.Handler):
+    """
+    Handler passing the records through a queue to a background thread which 
+    emits them with the given handlers
+    
+    The logging thread only merges the message arguments, formatting and 
+    writing are done by the background thread which flushes the handlers 
+    once for each batch of queued records.
+    """
+    batch_size = 100
+    
+    def __init__(self, handlers):
+        logging.Handler.__init__(self)
+        self.handlers = handlers
+        self.queue = Queue.Queue()
+        self.thread = threading.Thread(target=self.process, name='logging')
+        self.thread.daemon = True
+        self.thread.start()
+    
+    def prepare(self, record):
+        """
+        Merge the message arguments and the exception into the record, since 
+        they could have changed or be gone once the record is emitted
+        """
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+    
+    def emit(self, record):
+        try:
+            self.queue.put(self.prepare(record))
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except:
+            self.handleError(record)
+    
+    def process(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Queue.Empty:
+                    break
+            
+            for handler in self.handlers:
+                handler.batching = True
+                try:
+                    for record in batch:
+                        if record is not None and record.levelno >= handler.level:
+                            handler.handle(record)
+                finally:
+                    handler.batching = False
+                    handler.flush()
+            
+            for record in batch:
+                self.queue.task_done()
+            if None in batch:
+                break
+    
+    def flush(self):
+        """
+        Wait until the queued records are written
+        """
+        if self.thread.is_alive():
+            self.queue.join()
+    
+    def close(self):
+        # Called at exit, the background thread writes the remaining records 
+        # then stops
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        logging.Handler.close(self)
+
+
+def set_text_format(logger, fmt):
+    """
+    Set the format of the logger handlers, including the ones behind an 
+    asynchronous handler, the JSON ones are left untouched
+    """
+    handlers = []
+    for handler in logger.handlers:
+        handlers.extend(getattr(handler, 'handlers', [handler]))
+    for handler in handlers:
+        if not isinstance(handler.formatter, JsonFormatter):
+            handler.setFormatter(logging.Formatter(fmt))
+
+
+def init_logging(loglevel, printout=True, logfile=None, logfile_format='text', buffered=False):
     """
     Initialize the app's logger
+    
+    @logfile_format is 'text' or 'json' for JSON lines. If @buffered is True 
+    the records are written by a background thread (see ``AsyncHandler``).
     """
     rootlogger = logging.getLogger('po_projects_client')
     rootlogger.setLevel(getattr(logging, loglevel))
@@ -143,10 +284,26 @@ def init_logging(loglevel, printout=True, logfile=None):
         dummystream = StringIO()
         rootlogger.addHandler(logging.StreamHandler(dummystream))
     else:
+        handlers = []
         if printout:
-            rootlogger.addHandler(ColorizingStreamHandler())
+            handlers.append(ColorizingStreamHandler())
         if logfile:
-            rootlogger.addHandler(logging.FileHandler(logfile))
+            filehandler = BufferedFileHandler(logfile)
+            if logfile_format == 'json':
+                filehandler.setFormatter(JsonFormatter())
+            handlers.append(filehandler)
+        if buffered:
+            handlers = [AsyncHandler(handlers)]
+        for handler in handlers:
+            rootlogger.addHandler(handler)
+    
+    # Expose the HTTP connection pool logs, so connections reuse is visible
+    if loglevel == 'DEBUG':
+        for name in ('requests.packages.urllib3.connectionpool', 'urllib3.connectionpool'):
+            poollogger = logging.getLogger(name)
+            poollogger.setLevel(logging.DEBUG)
+            for handler in rootlogger.handlers:
+                poollogger.addHandler(handler)
     
     rootlogger.debug("Set logger level to: %s", loglevel)
     return rootlogger
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Per phase timings and counters of the client operations
+"""
+import contextlib, threading, time
+
+class Metrics(object):
+    """
+    Collect the time spent in named phases and some named counters
+    
+    Phases and counters are accumulated when used several times.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+    
+    def reset(self):
+        self.starttime = time.time()
+        self.phases = {}
+        self.counters = {}
+        # Keep the phase names in their first use order for display
+        self._order = []
+    
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.time()-start)
+    
+    def add_time(self, name, seconds):
+        with self._lock:
+            if name not in self.phases:
+                self._order.append(name)
+                self.phases[name] = 0.0
+            self.phases[name] += seconds
+    
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0)+value
+    
+    def elapsed(self):
+        return time.time()-self.starttime
+    
+    def ordered_phases(self):
+        """
+        Return a list of (name, seconds) for the phases in their first use
+        order
+        """
+        with self._lock:
+            return [(name, self.phases[name]) for name in self._order]
+    
+    def as_dict(self):
+        """
+        Return the metrics as a dict suitable for JSON
+        """
+        with self._lock:
+            return {
+                'total': self.elapsed(),
+                'phases': dict(self.phases),
+                'counters': dict(self.counters),
+            }
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+Process pool for the CPU bound catalog operations
+"""
+import multiprocessing
+
+def _call(args):
+    function, item = args
+    # Errors are returned since exceptions are not always picklable
+    try:
+        return item, function(item), None
+    except Exception as e:
+        return item, None, '{0}: {1}'.format(type(e).__name__, e)
+
+def map_processes(function, items, jobs=None):
+    """
+    Call the function with each item on a process pool of @jobs processes
+    (default to the CPU count), the function must be defined at a module level
+    
+    Return a list of (item, result, error) in the items order, the error is
+    a message or None if the function has not raised any exception
+    """
+    calls = [(function, item) for item in items]
+    jobs = min(jobs or multiprocessing.cpu_count(), len(calls))
+    if jobs <= 1:
+        return [_call(item) for item in calls]
+    pool = multiprocessing.Pool(jobs)
+    try:
+        return pool.map(_call, calls)
+    finally:
+        pool.close()
+        pool.join()
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP session shared by all the service endpoints
+"""
+import logging, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from po_projects_client import __version__ as client_version
+
+def build_session(pool_size=10):
+    """
+    Return a ``requests.Session`` with a keep-alive connection pool of
+    ``pool_size`` connections per host
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = 'po-projects-client/{0}'.format(client_version)
+    return session
+
+class ServiceUrl(object):
+    """
+    An endpoint url requested through a shared session, this mimics the
+    ``nap.url.Url`` API
+    
+    Default keyword arguments are given to every request made from this url
+    and the ones it joins.
+    """
+    def __init__(self, base_url, session, **default_kwargs):
+        self.logger = logging.getLogger('po_projects_client')
+        self.base_url = base_url
+        self.session = session
+        self.default_kwargs = default_kwargs
+    
+    def join(self, relative_url):
+        return ServiceUrl(urlparse.urljoin(self.base_url, relative_url), self.session, **self.default_kwargs)
+    
+    def request(self, method, **kwargs):
+        request_kwargs = self.default_kwargs.copy()
+        request_kwargs.update(kwargs)
+        response = self.session.request(method, self.base_url, **request_kwargs)
+        self.logger.debug("%s %s: %s (%s)", method, response.url, response.status_code, response.elapsed)
+        return response
+    
+    def get(self, **kwargs):
+        return self.request('GET', **kwargs)
+    
+    def head(self, **kwargs):
+        return self.request('HEAD', **kwargs)
+    
+    def patch(self, **kwargs):
+        return self.request('PATCH', **kwargs)
+    
+    def post(self, **kwargs):
+        return self.request('POST', **kwargs)
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Client states keeped between runs, like the cached project metadata
+"""
+import json, os, threading
+
+from po_projects_client.catalog import write_atomic
+
+class JSONFile(object):
+    """
+    Base of the JSON files keeped between runs
+    
+    The file is loaded once, it can be shared between threads with the
+    '_lock' attribute. Subclasses set '_changed' when they modify the datas,
+    changes are only written on ``save``.
+    """
+    # Options of 'json.dumps' to write the file
+    dump_options = {'separators': (',', ':')}
+    
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self._lock = threading.Lock()
+        self._changed = False
+        self._datas = self._load()
+    
+    def _load(self):
+        if not os.path.exists(self.filepath):
+            return {}
+        try:
+            with open(self.filepath, 'rb') as fp:
+                return json.load(fp)
+        except ValueError:
+            # A corrupted file is just like an empty one
+            return {}
+    
+    def _write(self, datas):
+        # Never leave a partial file
+        write_atomic(self.filepath, json.dumps(datas, **self.dump_options))
+    
+    def save(self):
+        """
+        Write the datas if they have changed, return the file path or None if
+        there was nothing to write
+        """
+        with self._lock:
+            if not self._changed:
+                return None
+            self._write(self._datas)
+            self._changed = False
+        return self.filepath
+
+
+class StateFile(JSONFile):
+    """
+    A JSON file storing values by sections and keys
+    
+    It can be shared between threads, changes are only written on ``save``
+    and are merged over the current file content so concurrent processes do
+    not lose each other values.
+    """
+    dump_options = {'indent': 1, 'sort_keys': True}
+    
+    def __init__(self, filepath):
+        super(StateFile, self).__init__(filepath)
+        self._changes = {}
+    
+    def get(self, section, key, default=None):
+        with self._lock:
+            return self._datas.get(section, {}).get(key, default)
+    
+    def set(self, section, key, value):
+        with self._lock:
+            self._datas.setdefault(section, {})[key] = value
+            self._changes.setdefault(section, {})[key] = value
+    
+    def save(self):
+        """
+        Write the changes to the file, return the file path or None if there
+        was nothing to write
+        """
+        with self._lock:
+            if not self._changes:
+                return None
+            datas = self._load()
+            for section, values in self._changes.items():
+                datas.setdefault(section, {}).update(values)
+            self._write(datas)
+            self._datas = datas
+            self._changes = {}
+        return self.filepath
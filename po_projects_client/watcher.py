@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Watch a catalog file for changes
+
+The inotify watcher needs the optional 'pyinotify' package, the polling
+watcher is used when it is not available.
+"""
+import logging, os, time
+
+class BaseWatcher(object):
+    """
+    Base watcher for a single file, subclasses implement ``wait``
+    """
+    def __init__(self, filepath):
+        self.logger = logging.getLogger('po_projects_client')
+        self.filepath = os.path.abspath(filepath)
+    
+    def wait(self, timeout=None):
+        """
+        Wait for a change of the file during @timeout seconds (forever if
+        None), return True if it has changed
+        """
+        raise NotImplementedError
+    
+    def reset(self):
+        """
+        Forget about the changes made until now
+        """
+        while self.wait(0):
+            pass
+    
+    def close(self):
+        pass
+    
+    def changes(self, debounce=2.0):
+        """
+        Yield once for each burst of changes, when the file has not changed
+        since @debounce seconds
+        """
+        while True:
+            if not self.wait():
+                continue
+            while self.wait(debounce):
+                pass
+            yield
+
+
+class PollingWatcher(BaseWatcher):
+    """
+    Watch the file by comparing its stats every @interval seconds
+    """
+    name = 'polling'
+    
+    def __init__(self, filepath, interval=1.0):
+        super(PollingWatcher, self).__init__(filepath)
+        self.interval = interval
+        self.signature = self.get_signature()
+    
+    def get_signature(self):
+        try:
+            stat = os.stat(self.filepath)
+        except OSError:
+            return None
+        return (stat.st_mtime, stat.st_size, stat.st_ino)
+    
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.time()+timeout
+        while True:
+            signature = self.get_signature()
+            if signature != self.signature:
+                self.signature = signature
+                return True
+            if deadline is not None and time.time() >= deadline:
+                return False
+            delay = self.interval if deadline is None else min(self.interval, deadline-time.time())
+            time.sleep(max(delay, 0))
+
+
+class InotifyWatcher(BaseWatcher):
+    """
+    Watch the file with inotify
+    
+    The file directory is watched since the file can be replaced with a
+    rename or removed then created again. The directory itself can be replaced
+    (like by a pull), ``reset`` watches the current one again.
+    """
+    name = 'inotify'
+    
+    def __init__(self, filepath):
+        import pyinotify
+        super(InotifyWatcher, self).__init__(filepath)
+        self.changed = False
+        
+        watcher = self
+        class Handler(pyinotify.ProcessEvent):
+            def process_default(self, event):
+                if event.pathname == watcher.filepath:
+                    watcher.changed = True
+        
+        self.manager = pyinotify.WatchManager()
+        self.notifier = pyinotify.Notifier(self.manager, default_proc_fun=Handler())
+        self.mask = pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO | pyinotify.IN_CREATE | pyinotify.IN_DELETE
+        self.watches = self.manager.add_watch(os.path.dirname(self.filepath), self.mask, quiet=False)
+    
+    def reset(self):
+        # Pending events are processed first, the watches of removed 
+        # directories are dropped with them
+        super(InotifyWatcher, self).reset()
+        # The watch follows the directory inode, a replaced directory is not 
+        # watched anymore
+        self.manager.rm_watch([wd for wd in self.watches.values() if self.manager.get_path(wd) is not None], quiet=True)
+        self.watches = self.manager.add_watch(os.path.dirname(self.filepath), self.mask, quiet=True)
+        if any([wd < 0 for wd in self.watches.values()]):
+            self.logger.warning("Unable to watch the directory of %s", self.filepath)
+    
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.time()+timeout
+        self.changed = False
+        while not self.changed:
+            remaining = None if deadline is None else max(deadline-time.time(), 0)
+            if self.notifier.check_events(timeout=None if remaining is None else remaining*1000):
+                self.notifier.read_events()
+                self.notifier.process_events()
+            elif deadline is not None:
+                break
+        return self.changed
+    
+    def close(self):
+        self.notifier.stop()
+
+
+def get_watcher(filepath, interval=1.0):
+    """
+    Return an inotify watcher for the file if possible, else a polling
+    watcher checking it every @interval seconds
+    """
+    logger = logging.getLogger('po_projects_client')
+    try:
+        return InotifyWatcher(filepath)
+    except ImportError:
+        logger.debug("'pyinotify' is not installed, using the polling watcher")
+    except Exception as e:
+        logger.debug("Unable to use inotify (%s: %s), using the polling watcher", type(e).__name__, e)
+    return PollingWatcher(filepath, interval=interval)
@@ -21,7 +21,7 @@ setup(
         'Topic :: Software Development :: Libraries :: Python Modules',
     ],
     install_requires=[
-        'nap >= 1.0.0',
+        'requests >= 2.4.0',
         'pkginfo >= 1.2b1',
         'argparse==1.2.1',
         'argcomplete==0.8.0',